@@ -0,0 +1,179 @@
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+
+class LogIndex(object):
+    """The rows of many logs in one columnar store: a raw float64 file per column (as FileListener writes with
+    log_columns), the keys of every run (parsed from its path) and the contiguous rows it spans, and the mtime and
+    size of every log ingested, so that only new or changed logs are parsed again."""
+    keys = ["size", "solver", "seed", "task", "brain", "island", "file"]
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        manifest_file = os.path.join(index_dir, "manifest.json")
+        if os.path.isfile(manifest_file):
+            with open(manifest_file, "r") as file:
+                manifest = json.load(file)
+        else:
+            manifest = {"files": {}, "runs": [], "columns": [], "rows": 0}
+        self.files = manifest["files"]
+        self.runs = manifest["runs"]
+        self.columns = manifest["columns"]
+        self.rows = manifest["rows"]
+
+    def ingest(self, file_names):
+        """Adds new logs, replaces changed ones and drops the ones that no longer exist; returns how many logs were
+        parsed."""
+        signatures = {}
+        for file_name in file_names:
+            stat = os.stat(file_name)
+            signatures[file_name] = [stat.st_mtime_ns, stat.st_size]
+        parsed = [file_name for file_name in sorted(signatures) if self.files.get(file_name) != signatures[file_name]]
+        stale = set(file_name for file_name in self.files if file_name not in signatures or file_name in parsed)
+        logs = [(file_name, ) + read_log(file_name) for file_name in parsed]
+        if not os.path.isdir(self.index_dir):
+            os.makedirs(self.index_dir)
+        if stale:
+            self._drop(stale)
+        for _, header, _ in logs:
+            for col in header:
+                if col not in self.columns:
+                    # rows ingested before this column existed do not have it
+                    np.full(self.rows, np.nan).tofile(self._get_column_file_name(col))
+                    self.columns.append(col)
+        for col in self.columns:
+            with open(self._get_column_file_name(col), "r+b") as file:
+                # whatever a previous, interrupted ingestion appended past the manifest is overwritten
+                file.truncate(self.rows * 8)
+                file.seek(0, os.SEEK_END)
+                for _, header, values in logs:
+                    column = values[:, header.index(col)] if col in header else np.full(len(values), np.nan)
+                    file.write(column.astype("<f8").tobytes())
+        for file_name, header, values in logs:
+            self.runs.append(dict(parse_run_keys(file_name), start=self.rows, stop=self.rows + len(values)))
+            self.files[file_name] = signatures[file_name]
+            self.rows += len(values)
+        self._save_manifest()
+        return len(logs)
+
+    def _drop(self, file_names):
+        """Rewrites the columns without the rows of the given logs."""
+        kept = [run for run in self.runs if run["file"] not in file_names]
+        rows = np.concatenate([np.arange(run["start"], run["stop"]) for run in kept]) if kept \
+            else np.empty(0, dtype=int)
+        for col in self.columns:
+            values = np.fromfile(self._get_column_file_name(col), dtype="<f8", count=self.rows)[rows]
+            values.tofile(self._get_column_file_name(col))
+        start = 0
+        for run in kept:
+            run["start"], run["stop"] = start, start + run["stop"] - run["start"]
+            start = run["stop"]
+        self.runs = kept
+        self.rows = start
+        for file_name in file_names:
+            del self.files[file_name]
+
+    def _save_manifest(self):
+        manifest_file = os.path.join(self.index_dir, "manifest.json")
+        with open(manifest_file + ".tmp", "w") as file:
+            json.dump({"files": self.files, "runs": self.runs, "columns": self.columns, "rows": self.rows}, file)
+        os.replace(manifest_file + ".tmp", manifest_file)
+
+    def _get_column_file_name(self, col):
+        return os.path.join(self.index_dir, ".".join([col, "float64"]))
+
+    def select(self, **keys):
+        """Returns the runs whose keys have the given values (e.g., task="hilly", seed=0)."""
+        return [run for run in self.runs if all(run.get(key) == value for key, value in keys.items())]
+
+    def column(self, col, runs=None):
+        """Returns the values of a column for the given runs (all of them if None), concatenated in their order."""
+        if col not in self.columns:
+            raise ValueError("Invalid column: {}".format(col))
+        values = np.memmap(self._get_column_file_name(col), dtype="<f8", mode="r", shape=(self.rows,)) \
+            if self.rows else np.empty(0)
+        if runs is None:
+            return np.array(values)
+        return np.concatenate([values[run["start"]:run["stop"]] for run in runs] + [np.empty(0)])
+
+    def aggregate(self, col, by, per="iteration", func=np.median, **keys):
+        """Groups the selected runs by the given keys and, within each group, aggregates col over the rows with the
+        same value of per (e.g., the median best fitness per generation per task); returns {group: (per, col)}."""
+        groups = {}
+        for run in self.select(**keys):
+            groups.setdefault(tuple(run[key] for key in by), []).append(run)
+        result = {}
+        for group, runs in sorted(groups.items(), key=lambda item: str(item[0])):
+            x, y = self.column(per, runs), self.column(col, runs)
+            valid = ~ (np.isnan(x) | np.isnan(y))
+            x, y = x[valid], y[valid]
+            unique, inverse = np.unique(x, return_inverse=True)
+            order = np.argsort(inverse, kind="stable")
+            splits = np.cumsum(np.bincount(inverse.ravel(), minlength=len(unique)))[:-1]
+            result[group] = unique, np.array([func(values) for values in np.split(y[order], splits)])
+        return result
+
+
+def read_log(file_name):
+    """Parses a `;`-separated log into its header and a float64 array, values that are not numbers become NaN."""
+    with open(file_name, "r") as file:
+        header = file.readline().rstrip("\n").split(";")
+        rows = [line.rstrip("\n").split(";") for line in file if line.strip()]
+    rows = [row[:len(header)] + ["nan"] * (len(header) - len(row)) for row in rows]
+    try:
+        values = np.array(rows, dtype=np.float64).reshape(len(rows), len(header))
+    except ValueError:
+        values = np.array([[to_float(value) for value in row] for row in rows],
+                          dtype=np.float64).reshape(len(rows), len(header))
+    return header, values
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def parse_run_keys(file_name):
+    """Keys of a run from the path of its log, output/<size>/logs/<solver>.<seed>.<task>.<brain>[.island<i>].txt"""
+    name = os.path.splitext(os.path.basename(file_name))[0]
+    keys = dict.fromkeys(LogIndex.keys)
+    keys["file"] = file_name
+    keys["size"] = os.path.basename(os.path.dirname(os.path.dirname(file_name)))
+    parts = name.split(".")
+    if len(parts) >= 4 and parts[1].isdigit():
+        keys["solver"], keys["seed"], keys["task"], keys["brain"] = parts[0], int(parts[1]), parts[2], parts[3]
+        if len(parts) > 4 and parts[4].startswith("island"):
+            keys["island"] = int(parts[4][len("island"):])
+    return keys
+
+
+def find_logs(output_dir):
+    return sorted(glob.glob(os.path.join(os.path.abspath(output_dir), "*", "logs", "*.txt")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ingests the logs of all experiments into one columnar index")
+    parser.add_argument("--output", default="output", help="the directory with the <size>/logs directories")
+    parser.add_argument("--index", default=os.path.join("output", "index"))
+    parser.add_argument("--query", default=None, help="column to aggregate after ingesting, e.g. best.fitness")
+    parser.add_argument("--by", nargs="+", default=["task"], choices=LogIndex.keys)
+    parser.add_argument("--per", default="iteration")
+    args = parser.parse_args()
+    start_time = time.time()
+    index = LogIndex(args.index)
+    num_parsed = index.ingest(find_logs(args.output))
+    print("parsed {} logs in {:.2f} sec, {} runs and {} rows indexed".format(num_parsed, time.time() - start_time,
+                                                                           len(index.runs), index.rows))
+    if args.query is not None:
+        start_time = time.time()
+        for group, (x, y) in index.aggregate(args.query, args.by, args.per).items():
+            for per, value in zip(x, y):
+                print("\t".join([str(key) for key in group] + [str(per), str(value)]))
+        print("aggregated in {:.2f} sec".format(time.time() - start_time))
@@ -0,0 +1,107 @@
+import json
+import os
+
+import numpy as np
+
+
+class MemmapArray(object):
+    """A 2-d array on disk that grows by rows, after a fixed-size text header with its dtype, its number of columns
+    and the number of rows written so far. The file is preallocated (sparse until written) and doubled when full."""
+    header_size = 128
+
+    def __init__(self, file_name, dtype, columns, capacity):
+        self.file_name = file_name
+        self.dtype = np.dtype(dtype)
+        self.columns = columns
+        self.rows = 0
+        self._file = open(file_name, "w+b")
+        self._data = None
+        self._resize(max(capacity, 1))
+        self._write_header()
+
+    def _resize(self, capacity):
+        if self._data is not None:
+            self._data.flush()
+            del self._data
+        self.capacity = capacity
+        self._file.truncate(self.header_size + capacity * self.columns * self.dtype.itemsize)
+        self._data = np.memmap(self._file, dtype=self.dtype, mode="r+", offset=self.header_size,
+                               shape=(capacity, self.columns))
+
+    def _write_header(self):
+        header = json.dumps({"dtype": self.dtype.str, "columns": self.columns, "rows": self.rows})
+        self._file.seek(0)
+        self._file.write((header.ljust(self.header_size - 1) + "\n").encode("ascii"))
+        self._file.flush()
+
+    def append(self, rows):
+        rows = np.asarray(rows).reshape(-1, self.columns)
+        if self.rows + len(rows) > self.capacity:
+            self._resize(max(2 * self.capacity, self.rows + len(rows)))
+        self._data[self.rows:self.rows + len(rows)] = rows
+        self.rows += len(rows)
+        # the data is in place before the header counts it
+        self._write_header()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._data.flush()
+        del self._data
+        # gives back the preallocated rows that were never written
+        self._file.truncate(self.header_size + self.rows * self.columns * self.dtype.itemsize)
+        self._file.close()
+
+    @classmethod
+    def read(cls, file_name):
+        """Maps the rows written so far read-only, nothing is loaded until sliced."""
+        with open(file_name, "rb") as file:
+            header = json.loads(file.read(cls.header_size).decode("ascii"))
+        if header["rows"] == 0:
+            return np.empty((0, header["columns"]), dtype=header["dtype"])
+        return np.memmap(file_name, dtype=header["dtype"], mode="r", offset=cls.header_size,
+                         shape=(header["rows"], header["columns"]))
+
+
+class PopulationArchive(object):
+    """Every evaluated candidate of a run, with its fitness and generation, appended to memory-mapped files."""
+    fields = ["solutions", "fitness", "generation"]
+
+    def __init__(self, file_name, size, num_params, dtype, capacity):
+        archive_dir = os.path.dirname(self.get_archive_file_name(file_name, size, "solutions"))
+        if not os.path.isdir(archive_dir):
+            os.makedirs(archive_dir)
+        self.solutions = MemmapArray(self.get_archive_file_name(file_name, size, "solutions"), dtype, num_params,
+                                     capacity)
+        self.fitness = MemmapArray(self.get_archive_file_name(file_name, size, "fitness"), np.float64, 1, capacity)
+        self.generation = MemmapArray(self.get_archive_file_name(file_name, size, "generation"), np.int32, 1,
+                                      capacity)
+
+    @classmethod
+    def create_archive(cls, config, file_name, num_params):
+        # the last generation may overshoot the evaluations, the files grow if needed
+        return cls(file_name, config["size"], num_params, config["dtype"], config["evaluations"])
+
+    def append(self, generation, solutions, fitness):
+        self.solutions.append(solutions)
+        self.fitness.append(fitness)
+        self.generation.append(np.full(len(fitness), generation))
+
+    def close(self):
+        for field in self.fields:
+            getattr(self, field).close()
+
+    @classmethod
+    def load(cls, file_name, size):
+        """Returns the solutions (n x d), fitness (n) and generation (n) of the n candidates archived so far, as
+        read-only memory maps."""
+        archive = {field: MemmapArray.read(cls.get_archive_file_name(file_name, size, field))
+                   for field in cls.fields}
+        # a run still going (or interrupted) may have appended to some files only
+        length = min([len(values) for values in archive.values()])
+        return {"solutions": archive["solutions"][:length], "fitness": archive["fitness"][:length, 0],
+                "generation": archive["generation"][:length, 0]}
+
+    @classmethod
+    def get_archive_file_name(cls, file_name, size, field):
+        return ".".join([os.path.join(os.getcwd(), "output", size, "archives", file_name), field, "mmap"])
@@ -0,0 +1,316 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import pickle
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import yaml
+
+from controllers import BaseController
+from es import CMAES, SepCMAES, LMMAES, RestartCMAES, SimpleGA, OpenES, PEPG
+from utils import create_solver, random_solution, set_seed
+
+
+# all solvers maximize, the optimum (of value 0) is away from 0, where the mean-based solvers start
+def sphere(x):
+    return - np.sum((x - 0.5) ** 2, axis=1)
+
+
+def rastrigin(x):
+    z = x - 0.5
+    return - (10 * z.shape[1] + np.sum(z * z - 10 * np.cos(2 * np.pi * z), axis=1))
+
+
+def rosenbrock(x):
+    return - np.sum(100 * (x[:, 1:] - x[:, :-1] ** 2) ** 2 + (1 - x[:, :-1]) ** 2, axis=1)
+
+
+FUNCTIONS = {"sphere": sphere, "rastrigin": rastrigin, "rosenbrock": rosenbrock}
+
+SOLVERS = {
+    "cmaes": lambda n, p, seed: CMAES(n, sigma_init=0.5, popsize=p, weight_decay=0, seed=seed),
+    "sep-cmaes": lambda n, p, seed: SepCMAES(n, sigma_init=0.5, popsize=p, weight_decay=0),
+    "lm-cmaes": lambda n, p, seed: LMMAES(n, sigma_init=0.5, popsize=p, weight_decay=0),
+    "ipop-cmaes": lambda n, p, seed: RestartCMAES(n, sigma_init=0.5, popsize=p, weight_decay=0),
+    "ga": lambda n, p, seed: SimpleGA(n, popsize=p, weight_decay=0),
+    "es": lambda n, p, seed: OpenES(n, popsize=p, rank_fitness=False, forget_best=False, weight_decay=0),
+    "pepg": lambda n, p, seed: PEPG(n, popsize=p, forget_best=False, weight_decay=0),
+}
+
+
+def benchmark_solver(solver_name, function_name, num_params, popsize, generations, seed=0):
+    """Times ask() and tell() of a solver on a synthetic function, apart from any simulation, and tracks the best
+    value found; the peak memory they allocate is measured in a separate, shorter run, as tracing slows them down."""
+    function = FUNCTIONS[function_name]
+    np.random.seed(seed)
+    # pycma prints on creation and every 100 iterations
+    with contextlib.redirect_stdout(io.StringIO()):
+        solver = SOLVERS[solver_name](num_params, popsize, seed + 1)
+        ask_time, tell_time, best, curve = 0.0, 0.0, float("-inf"), []
+        for _ in range(generations):
+            start = time.perf_counter()
+            solutions = np.asarray(solver.ask())
+            ask_time += time.perf_counter() - start
+            fitness = function(solutions)
+            start = time.perf_counter()
+            solver.tell(fitness)
+            tell_time += time.perf_counter() - start
+            # the best objective value so far, since some solvers report ranks or weight decayed rewards
+            best = max(best, float(np.max(fitness)))
+            curve.append(best)
+
+        tracemalloc.start()
+        solver = SOLVERS[solver_name](num_params, popsize, seed + 1)
+        for _ in range(2):
+            solver.tell(function(np.asarray(solver.ask())))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {"solver": solver_name, "function": function_name, "num_params": num_params, "popsize": popsize,
+            "generations": generations, "seed": seed,
+            "ask.sec": ask_time / generations, "tell.sec": tell_time / generations,
+            "generation.sec": (ask_time + tell_time) / generations, "peak.mb": peak / 2 ** 20,
+            "best.fitness": curve[-1], "fitness": curve}
+
+
+def benchmark_solvers(solvers, functions, num_params, popsizes, generations, seed=0):
+    results = []
+    for solver_name in solvers:
+        for function_name in functions:
+            for n in num_params:
+                for p in popsizes:
+                    result = benchmark_solver(solver_name, function_name, n, p, generations, seed)
+                    print("{} {} num_params={} popsize={}: {:.4f} sec/gen, {:.1f}MB, best {:.4g}".format(
+                        solver_name, function_name, n, p, result["generation.sec"], result["peak.mb"],
+                        result["best.fitness"]))
+                    results.append(result)
+    return results
+
+
+BODIES = ["pressure", "voxel", "tensegrity"]
+TASKS = ["flat", "hilly-3-10", "escape", "climber", "cave", "carrier"]
+BRAINS = ["random", "phase", "mlp"]
+
+
+def benchmark_simulation(config, repeats=3):
+    """Times headless episodes of a random solution; the median over the repeats is reported, as the first episode
+    in a process also pays for imports and allocations."""
+    # Box2D's example framework parses sys.argv when imported, so it is only imported once the arguments are parsed
+    from simulation import simulation
+    config = dict(config, save_video=0)
+    config["n_params"] = BaseController.get_number_of_params_for_controller(config)
+    result = {key: config[key] for key in ["body", "task", "n_masses", "brain", "control_pressure", "control_joints",
+                                           "timesteps", "seed"]}
+    result["repeats"] = repeats
+    telemetry_list = []
+    try:
+        for _ in range(repeats):
+            set_seed(config["seed"])
+            telemetry = {}
+            simulation(config, random_solution(config), render=False, telemetry=telemetry)
+            telemetry_list.append(telemetry)
+    except Exception as e:
+        # some bodies do not support every task or brain, record it and go on with the matrix
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+        return result
+    result["steps"] = telemetry_list[0]["steps"]
+    result["steps.per.sec"] = float(np.median([telemetry["steps"] / telemetry["episode.sec"]
+                                               for telemetry in telemetry_list]))
+    for col in ["rollout.sec", "construction.sec", "world.step.sec", "physics.step.sec", "sensor.sec",
+                "controller.sec", "apply.control.sec", "should.step.sec"]:
+        result[col] = float(np.median([telemetry[col] for telemetry in telemetry_list]))
+    return result
+
+
+def benchmark_simulations(config, bodies, tasks, n_masses, brains, control_pressure, control_joints, timesteps,
+                          repeats=3, seed=0):
+    results = []
+    for body, task, n, brain, pressure, joints in itertools.product(bodies, tasks, n_masses, brains,
+                                                                    control_pressure, control_joints):
+        result = benchmark_simulation(dict(config, body=body, task=task, n_masses=n, brain=brain,
+                                           control_pressure=pressure, control_joints=joints, timesteps=timesteps,
+                                           seed=seed), repeats)
+        print("{} {} n_masses={} {} control_pressure={} control_joints={}: {}".format(
+            body, task, n, brain, pressure, joints, result["error"] if "error" in result else
+            "{:.0f} steps/sec, {:.3f} sec/episode".format(result["steps.per.sec"], result["rollout.sec"])))
+        results.append(result)
+    return results
+
+
+class MemoryListener(object):
+    """Keeps the rows of parallel_solve in memory, instead of writing them to a log."""
+
+    def __init__(self):
+        self.file_name = "scaling"
+        self.size = "benchmarks"
+        self.rows = []
+
+    def listen(self, **kwargs):
+        self.rows.append(kwargs)
+
+    def save_best(self, solution):
+        pass
+
+
+def benchmark_scaling(config, worker_counts, generations):
+    """Runs the same generations of parallel_solve with every number of workers, and splits the time into pool
+    start-up (and shut-down), pickling of the candidates, simulation (per worker), solver and the rest (transfers,
+    idle workers at the end of a generation)."""
+    from simulation import parallel_solve
+    config = dict(config, save_video=0, save_replay=0, save_archive=0, profile=0)
+    config["n_params"] = BaseController.get_number_of_params_for_controller(config)
+    results = []
+    for num_workers in worker_counts:
+        set_seed(config["seed"])
+        # the population does not depend on the number of workers (e.g., cmaes rounds it up to a multiple of it)
+        solver = create_solver(dict(config, np=1))
+        listener = MemoryListener()
+        start = time.perf_counter()
+        parallel_solve(solver, generations, dict(config, np=num_workers, evaluations=generations * solver.popsize),
+                       listener)
+        wall_time = time.perf_counter() - start
+        evaluations = sum([row["popsize"] for row in listener.rows])
+        # what submit_generation sends, pickled again on its own
+        if getattr(solver, "noise_table", None) is not None:
+            tasks = [(config, 0, 1, i) for i in range(solver.popsize)]
+        else:
+            solutions = np.random.random((solver.popsize, solver.num_params)).astype(config["dtype"])
+            tasks = [(config, solutions[i], i) for i in range(solver.popsize)]
+        start = time.perf_counter()
+        for _ in range(generations):
+            pickle.dumps(tasks)
+        pickling_time = time.perf_counter() - start
+        simulation_time = sum([row["rollout.sec"] * row["popsize"] for row in listener.rows]) / num_workers
+        solver_time = sum([row["solver.sec"] for row in listener.rows])
+        startup_time = wall_time - listener.rows[-1]["elapsed.sec"]
+        result = {key: config[key] for key in ["solver", "body", "task", "n_masses", "brain", "timesteps", "seed"]}
+        result.update(**{"np": num_workers, "popsize": solver.popsize, "generations": generations,
+                         "evaluations": evaluations, "wall.sec": wall_time,
+                         "evaluations.per.sec": evaluations / wall_time, "startup.sec": startup_time,
+                         "pickling.sec": pickling_time, "simulation.sec": simulation_time, "solver.sec": solver_time,
+                         "other.sec": wall_time - startup_time - pickling_time - simulation_time - solver_time})
+        # relative to as many single workers, with no parallel overhead
+        result["efficiency"] = result["evaluations.per.sec"] / (num_workers * results[0]["evaluations.per.sec"] /
+                                                               results[0]["np"]) if results else 1.0
+        print("np={}: {:.1f} evaluations/sec, efficiency {:.2f}, start-up {:.2f} sec, pickling {:.2f} sec, "
+              "simulation {:.2f} sec, solver {:.2f} sec, other {:.2f} sec".format(
+                num_workers, result["evaluations.per.sec"], result["efficiency"], startup_time, pickling_time,
+                simulation_time, solver_time, result["other.sec"]))
+        results.append(result)
+    return results
+
+
+# what identifies a result, and the measure compared between runs with whether higher is better
+KEYS = ["solver", "function", "num_params", "popsize", "generations", "body", "task", "n_masses", "brain",
+        "control_pressure", "control_joints", "timesteps", "seed", "np"]
+MEASURES = {"steps.per.sec": True, "generation.sec": False, "evaluations.per.sec": True}
+
+
+def compare_results(baseline, results, tolerance=0.1):
+    """Returns the results whose measure got worse than the baseline by more than tolerance (relative), each with
+    the ratio of the new measure to the old one."""
+    baseline = {tuple((key, result.get(key)) for key in KEYS): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = baseline.get(tuple((key, result.get(key)) for key in KEYS))
+        if old is None:
+            continue
+        for measure, higher_is_better in MEASURES.items():
+            if measure not in result or measure not in old:
+                continue
+            ratio = result[measure] / old[measure]
+            if (ratio < 1 - tolerance) if higher_is_better else (ratio > 1 + tolerance):
+                regressions.append(dict({key: result[key] for key in KEYS if key in result}, measure=measure,
+                                        baseline=old[measure], value=result[measure], ratio=ratio))
+    return regressions
+
+
+def load_results(file_name):
+    with open(file_name, "r") as file:
+        return json.load(file)["results"]
+
+
+def get_machine_info():
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "numpy": np.__version__, "machine": platform.machine(), "processor": platform.processor(),
+            "cpus": os.cpu_count()}
+
+
+def save_results(file_name, results):
+    if os.path.dirname(file_name) and not os.path.isdir(os.path.dirname(file_name)):
+        os.makedirs(os.path.dirname(file_name))
+    with open(file_name, "w") as file:
+        json.dump({"machine": get_machine_info(), "results": results}, file, indent=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmarks of the solvers and of the simulation")
+    subparsers = parser.add_subparsers(dest="benchmark")
+    solvers_parser = subparsers.add_parser("solvers", help="the solvers alone, on synthetic functions")
+    solvers_parser.add_argument("--solvers", nargs="+", default=sorted(SOLVERS), choices=sorted(SOLVERS))
+    solvers_parser.add_argument("--functions", nargs="+", default=sorted(FUNCTIONS), choices=sorted(FUNCTIONS))
+    solvers_parser.add_argument("--num-params", nargs="+", type=int, default=[10, 100, 1000])
+    solvers_parser.add_argument("--popsizes", nargs="+", type=int, default=[16, 64, 256])
+    solvers_parser.add_argument("--generations", type=int, default=50)
+    solvers_parser.add_argument("--seed", type=int, default=0)
+    solvers_parser.add_argument("--output", default=os.path.join("output", "benchmarks", "solvers.json"))
+    simulation_parser = subparsers.add_parser("simulation", help="headless episodes, over bodies, tasks and brains")
+    # voxel and tensegrity bodies do not implement observations and control yet
+    simulation_parser.add_argument("--bodies", nargs="+", default=["pressure"], choices=BODIES)
+    simulation_parser.add_argument("--tasks", nargs="+", default=TASKS)
+    simulation_parser.add_argument("--n-masses", nargs="+", type=int, default=[10, 50, 100, 200])
+    simulation_parser.add_argument("--brains", nargs="+", default=BRAINS, choices=BRAINS)
+    simulation_parser.add_argument("--control-pressure", nargs="+", type=int, default=[0, 1], choices=[0, 1])
+    simulation_parser.add_argument("--control-joints", nargs="+", type=int, default=[0, 1], choices=[0, 1])
+    simulation_parser.add_argument("--timesteps", type=int, default=600)
+    simulation_parser.add_argument("--repeats", type=int, default=3)
+    simulation_parser.add_argument("--seed", type=int, default=0)
+    simulation_parser.add_argument("--output", default=os.path.join("output", "benchmarks", "simulation.json"))
+    scaling_parser = subparsers.add_parser("scaling", help="parallel_solve with increasing numbers of workers")
+    scaling_parser.add_argument("--np", nargs="+", type=int,
+                                default=[2 ** i for i in range(os.cpu_count().bit_length()) if 2 ** i <= os.cpu_count()])
+    scaling_parser.add_argument("--solver", default=None, help="defaults to the one in config.yaml")
+    scaling_parser.add_argument("--task", default="flat")
+    scaling_parser.add_argument("--n-masses", type=int, default=20)
+    scaling_parser.add_argument("--timesteps", type=int, default=300)
+    scaling_parser.add_argument("--generations", type=int, default=3)
+    scaling_parser.add_argument("--seed", type=int, default=0)
+    scaling_parser.add_argument("--output", default=os.path.join("output", "benchmarks", "scaling.json"))
+    compare_parser = subparsers.add_parser("compare", help="flags the regressions of a result file from a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+    if args.benchmark == "solvers":
+        save_results(args.output, benchmark_solvers(args.solvers, args.functions, args.num_params, args.popsizes,
+                                                    args.generations, args.seed))
+    elif args.benchmark == "simulation":
+        sys.argv = sys.argv[:1]
+        with open("config.yaml", "r") as yaml_file:
+            config = yaml.load(yaml_file, Loader=yaml.FullLoader)
+        save_results(args.output, benchmark_simulations(config, args.bodies, args.tasks, args.n_masses, args.brains,
+                                                        args.control_pressure, args.control_joints, args.timesteps,
+                                                        args.repeats, args.seed))
+    elif args.benchmark == "scaling":
+        sys.argv = sys.argv[:1]
+        with open("config.yaml", "r") as yaml_file:
+            config = yaml.load(yaml_file, Loader=yaml.FullLoader)
+        config.update(**{"task": args.task, "n_masses": args.n_masses, "timesteps": args.timesteps, "seed": args.seed,
+                         "size": "benchmarks", "solver": args.solver or config["solver"]})
+        save_results(args.output, benchmark_scaling(config, args.np, args.generations))
+    elif args.benchmark == "compare":
+        regressions = compare_results(load_results(args.baseline), load_results(args.results), args.tolerance)
+        for regression in regressions:
+            print("regression of {} from {:.4g} to {:.4g} ({:+.1%}): {}".format(
+                regression["measure"], regression["baseline"], regression["value"], regression["ratio"] - 1,
+                ", ".join(["{}={}".format(key, regression[key]) for key in KEYS if key in regression])))
+        print("{} regressions".format(len(regressions)))
+        sys.exit(1 if regressions else 0)
+    else:
+        parser.print_help()
@@ -1,9 +1,9 @@
 import abc
+import importlib
 import math
 import random
 
 import numpy as np
-import torch
 
 from soft_body import PressureSoftBody
 
@@ -128,9 +128,15 @@ class InflateController(BaseController):
         return 0
 
 
+def _torch():
+    # torch is slow to import and takes memory, so only the processes that evaluate mlp brains import it
+    return importlib.import_module("torch")
+
+
 class MLPController(BaseController):
 
     def __init__(self, input_dim, output_dim, control_pressure):
+        torch = _torch()
         BaseController.__init__(self, input_dim, output_dim)
         self.joint_nn = torch.nn.Sequential(
             torch.nn.Linear(in_features=self.input_dim, out_features=self.output_dim - 1),
@@ -156,6 +162,7 @@ class MLPController(BaseController):
         return params
 
     def set_params(self, params):
+        torch = _torch()
         state_dict = self.joint_nn.state_dict()
         start = 0
         for key, coeffs in state_dict.items():
@@ -173,7 +180,9 @@ class MLPController(BaseController):
         self.pressure_nn.load_state_dict(state_dict)
 
     def control(self, t, obs):
-        obs = torch.from_numpy(obs).float()
+        torch = _torch()
+        # no copy if the observations are already float32, like the network
+        obs = torch.as_tensor(obs, dtype=torch.float32)
         if not self.control_pressure:
             return self.joint_nn(obs).detach().numpy()
         return np.concatenate([self.joint_nn(obs).detach().numpy(), self.pressure_nn(obs).detach().numpy()])
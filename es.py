@@ -1,3 +1,6 @@
+import ctypes
+import multiprocessing
+
 import numpy as np
 
 
@@ -24,8 +27,70 @@ def compute_centered_ranks(x):
 
 
 def compute_weight_decay(weight_decay, model_param_list):
-    model_param_grid = np.array(model_param_list)
-    return - weight_decay * np.mean(model_param_grid * model_param_grid, axis=1)
+    model_param_grid = np.asarray(model_param_list)
+    return - weight_decay * np.einsum("ij,ij->i", model_param_grid, model_param_grid) / model_param_grid.shape[1]
+
+
+# adopted from:
+# https://github.com/openai/evolution-strategies-starter/blob/master/es_distributed/es.py
+
+class SharedNoiseTable(object):
+    """Read-only table of standard normal noise in shared memory, created once. A perturbation is then fully
+    described by an offset into the table and a sign, and any process holding the table can rebuild it."""
+    chunk_size = 2 ** 22
+
+    def __init__(self, size, seed=0):
+        self.size = size
+        self._shared = multiprocessing.RawArray(ctypes.c_float, size)
+        self.noise = np.frombuffer(self._shared, dtype=np.float32)
+        # drawn in chunks (the same numbers as all at once), so that no float64 copy of the whole table is ever made
+        random_state = np.random.RandomState(seed)
+        for start in range(0, size, self.chunk_size):
+            self.noise[start:start + self.chunk_size] = random_state.randn(min(self.chunk_size, size - start))
+
+    def __getstate__(self):
+        # the table can only be handed to processes at creation (e.g., a Pool initializer), never pickled per task
+        return {"size": self.size, "_shared": self._shared}
+
+    def __setstate__(self, state):
+        self.size = state["size"]
+        self._shared = state["_shared"]
+        self.noise = np.frombuffer(self._shared, dtype=np.float32)
+
+    def get(self, offset, dim):
+        return self.noise[offset:offset + dim]
+
+    def sample_offsets(self, n, dim):
+        assert (dim <= self.size), "Noise table smaller than the number of parameters."
+        return np.random.randint(0, self.size - dim + 1, size=n)
+
+    def perturb(self, mu, sigma, offset, sign):
+        # in the dtype of mu whether sigma is a scalar or a vector, so that both give the very same parameters
+        return mu + np.asarray(sign * sigma, dtype=mu.dtype) * self.get(offset, len(mu)).astype(mu.dtype)
+
+    def weighted_sum(self, weights, offsets, dim, power=1):
+        total = np.zeros(dim)
+        for weight, offset in zip(weights, offsets):
+            if weight != 0:
+                total += weight * self.get(offset, dim) ** power
+        return total
+
+
+class SampleAhead(object):
+    """Lets a solver draw the random numbers of its next ask() in advance, e.g., while the current population is being
+    evaluated. tell() draws none, so the random stream (and thus the search) is the same as without presampling."""
+    _presampled = None
+
+    def presample(self):
+        """to be called between ask() and tell()"""
+        self._presampled = self._sample()
+
+    def _sample(self):
+        raise NotImplementedError
+
+    def _next_sample(self):
+        sample, self._presampled = self._presampled, None
+        return sample if sample is not None else self._sample()
 
 
 # adopted from:
@@ -35,12 +100,13 @@ class Optimizer(object):
     def __init__(self, pi, epsilon=1e-08):
         self.pi = pi
         self.dim = pi.num_params
+        self.dtype = pi.mu.dtype
         self.epsilon = epsilon
         self.t = 0
 
     def update(self, glob_alg):
         self.t += 1
-        step = self._compute_step(glob_alg)
+        step = self._compute_step(np.asarray(glob_alg, dtype=self.dtype))
         theta = self.pi.mu
         ratio = np.linalg.norm(step) / (np.linalg.norm(theta) + self.epsilon)
         self.pi.mu = theta + step
@@ -63,7 +129,7 @@ class BasicSGD(Optimizer):
 class SGD(Optimizer):
     def __init__(self, pi, step_size, momentum=0.9):
         Optimizer.__init__(self, pi)
-        self.v = np.zeros(self.dim, dtype=np.float32)
+        self.v = np.zeros(self.dim, dtype=self.dtype)
         self.step_size, self.momentum = step_size, momentum
 
     def _compute_step(self, glob_alg):
@@ -78,11 +144,11 @@ class Adam(Optimizer):
         self.step_size = step_size
         self.beta1 = beta1
         self.beta2 = beta2
-        self.m = np.zeros(self.dim, dtype=np.float32)
-        self.v = np.zeros(self.dim, dtype=np.float32)
+        self.m = np.zeros(self.dim, dtype=self.dtype)
+        self.v = np.zeros(self.dim, dtype=self.dtype)
 
     def _compute_step(self, glob_alg):
-        a = self.step_size * np.sqrt(1 - self.beta2 ** self.t) / (1 - self.beta1 ** self.t)
+        a = float(self.step_size * np.sqrt(1 - self.beta2 ** self.t) / (1 - self.beta1 ** self.t))
         self.m = self.beta1 * self.m + (1 - self.beta1) * glob_alg
         self.v = self.beta2 * self.v + (1 - self.beta2) * (glob_alg * glob_alg)
         step = -a * self.m / (np.sqrt(self.v) + self.epsilon)
@@ -95,7 +161,9 @@ class CMAES(object):
     def __init__(self, num_params,  # number of model parameters
                  sigma_init=0.10,  # initial standard deviation
                  popsize=256,  # population size
-                 weight_decay=0.01):  # weight decay coefficient
+                 weight_decay=0.01,  # weight decay coefficient
+                 mean_init=None,  # initial mean, zeros if None
+                 seed=None):  # seed of pycma, which otherwise reseeds numpy from the clock
 
         self.num_params = num_params
         self.sigma_init = sigma_init
@@ -104,10 +172,12 @@ class CMAES(object):
         self.solutions = None
 
         import cma
-        self.es = cma.CMAEvolutionStrategy(self.num_params * [0],
+        options = {'popsize': self.popsize}
+        if seed is not None:
+            options['seed'] = seed
+        self.es = cma.CMAEvolutionStrategy(self.num_params * [0] if mean_init is None else list(mean_init),
                                            self.sigma_init,
-                                           {'popsize': self.popsize,
-                                            })
+                                           options)
 
     def rms_stdev(self):
         sigma = self.es.result[6]
@@ -131,6 +201,10 @@ class CMAES(object):
     def set_mu(self, mu):
         pass
 
+    def inject(self, param, reward):
+        """adds a solution evaluated elsewhere (e.g., on another island) to the next population"""
+        self.es.inject([param])
+
     def best_param(self):
         return self.es.result[0]  # best evaluated solution
 
@@ -139,7 +213,307 @@ class CMAES(object):
         return r[0], -r[1], -r[1], r[6]
 
 
-class SimpleGA(object):
+class RestartCMAES(object):
+    """CMA-ES with IPOP or BIPOP restarts (Auger and Hansen, 2005; Hansen, 2009).
+
+    Whenever a run stagnates, CMA-ES restarts from a random mean with a population twice as large (IPOP), or, with
+    BIPOP, alternatively with a small population and step size as long as small runs took fewer evaluations than
+    large ones. Population sizes are rounded up to multiples of popsize_unit (e.g., the number of workers), so that
+    every generation keeps all of them busy."""
+
+    def __init__(self, num_params,  # number of model parameters
+                 sigma_init=0.10,  # initial standard deviation
+                 popsize=None,  # population size of the first run, 4 + 3 ln(num_params) if None
+                 popsize_unit=1,  # population sizes are multiples of this
+                 regime="ipop",  # either "ipop" or "bipop"
+                 patience=30,  # restart if the best of a run does not improve for that many generations
+                 weight_decay=0.01):  # weight decay coefficient
+
+        if regime not in ["ipop", "bipop"]:
+            raise ValueError("Invalid restart regime: {}".format(regime))
+        self.num_params = num_params
+        self.sigma_init = sigma_init
+        self.popsize_unit = popsize_unit
+        self.default_popsize = popsize if popsize is not None else 4 + int(3 * np.log(num_params))
+        self.regime = regime
+        self.patience = patience
+        self.weight_decay = weight_decay
+
+        self.restarts = 0
+        self.n_large = 0
+        self.large_evaluations = 0
+        self.small_evaluations = 0
+        self.best_mu = np.zeros(self.num_params)
+        self.best_reward = float("-inf")
+        self.curr_best_reward = float("-inf")
+        self._start(self.default_popsize, self.sigma_init, np.zeros(self.num_params), True)
+
+    def _round_popsize(self, popsize):
+        return self.popsize_unit * int(np.ceil(popsize / self.popsize_unit))
+
+    def _start(self, popsize, sigma, mean, large):
+        self.popsize = self._round_popsize(popsize)
+        self.large = large
+        self.run_best_reward = float("-inf")
+        self.stagnation = 0
+        # pycma seeds numpy on creation, draw its seed so that restarts remain reproducible
+        self.cma = CMAES(self.num_params, sigma_init=sigma, popsize=self.popsize, weight_decay=self.weight_decay,
+                         mean_init=mean, seed=np.random.randint(1, 2 ** 31 - 1))
+
+    def _restart(self):
+        self.restarts += 1
+        mean = np.random.random(self.num_params) * 2 - 1.0
+        if self.regime == "bipop" and self.small_evaluations < self.large_evaluations:
+            large_popsize = self.default_popsize * 2 ** self.n_large
+            popsize = self.default_popsize * (large_popsize / self.default_popsize / 2) ** (np.random.random() ** 2)
+            sigma = self.sigma_init * 10 ** (- 2 * np.random.random())
+            self._start(popsize, sigma, mean, False)
+        else:
+            self.n_large += 1
+            self._start(self.default_popsize * 2 ** self.n_large, self.sigma_init, mean, True)
+
+    def rms_stdev(self):
+        return self.cma.rms_stdev()
+
+    def ask(self):
+        """returns a list of parameters"""
+        return self.cma.ask()
+
+    def tell(self, reward_table_result):
+        self.cma.tell(reward_table_result)
+        if self.large:
+            self.large_evaluations += self.popsize
+        else:
+            self.small_evaluations += self.popsize
+        self.curr_best_reward = np.max(reward_table_result)
+        best_mu, best_reward = self.cma.result()[:2]
+        if best_reward > self.best_reward:
+            self.best_reward = best_reward
+            self.best_mu = np.copy(best_mu)
+        if best_reward > self.run_best_reward:
+            self.run_best_reward = best_reward
+            self.stagnation = 0
+        else:
+            self.stagnation += 1
+        if self.stagnation >= self.patience or self.cma.es.stop():
+            self._restart()
+
+    def current_param(self):
+        return self.cma.current_param()
+
+    def set_mu(self, mu):
+        pass
+
+    def inject(self, param, reward):
+        """adds a solution evaluated elsewhere (e.g., on another island) to the next population"""
+        self.cma.inject(param, reward)
+
+    def best_param(self):
+        return self.best_mu
+
+    def result(self):  # return best params so far, along with historically best reward, curr reward, sigma
+        return self.best_mu, self.best_reward, self.curr_best_reward, self.cma.result()[3]
+
+
+def compute_recombination_weights(popsize):
+    """Positive log-decreasing weights of the best half of the population, and their variance effective mass."""
+    mu = popsize // 2
+    weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+    weights /= np.sum(weights)
+    return weights, 1.0 / np.sum(weights * weights)
+
+
+class SepCMAES(SampleAhead):
+    """Separable CMA-ES (Ros and Hansen, 2008), with a diagonal covariance: O(d) time and memory per sample."""
+
+    def __init__(self, num_params,  # number of model parameters
+                 sigma_init=0.10,  # initial standard deviation
+                 popsize=256,  # population size
+                 weight_decay=0.01):  # weight decay coefficient
+
+        self.num_params = num_params
+        self.sigma_init = sigma_init
+        self.popsize = popsize
+        self.weight_decay = weight_decay
+
+        n = self.num_params
+        self.weights, self.mueff = compute_recombination_weights(self.popsize)
+        self.mu = len(self.weights)
+        self.cc = 4.0 / (n + 4.0)
+        self.cs = (self.mueff + 2.0) / (n + self.mueff + 3.0)
+        # learning rates of the full CMA-ES, scaled up by (n + 2) / 3 since only n entries are learned
+        self.c1 = min(1.0, 2.0 / ((n + 1.3) ** 2 + self.mueff) * (n + 2.0) / 3.0)
+        self.cmu = min(1.0 - self.c1, 2.0 * (self.mueff - 2.0 + 1.0 / self.mueff) / ((n + 2.0) ** 2 + self.mueff) *
+                       (n + 2.0) / 3.0)
+        self.damps = 1.0 + 2.0 * max(0.0, np.sqrt((self.mueff - 1.0) / (n + 1.0)) - 1.0) + self.cs
+        self.chi_n = np.sqrt(n) * (1.0 - 1.0 / (4.0 * n) + 1.0 / (21.0 * n * n))
+
+        self.mean = np.zeros(n)
+        self.sigma = self.sigma_init
+        self.diag_c = np.ones(n)
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.t = 0
+        self.z = None
+        self.solutions = None
+        self.best_mu = np.zeros(n)
+        self.best_reward = float("-inf")
+        self.curr_best_reward = float("-inf")
+
+    def rms_stdev(self):
+        return self.sigma * np.mean(np.sqrt(self.diag_c))
+
+    def _sample(self):
+        return np.random.randn(self.popsize, self.num_params)
+
+    def ask(self):
+        """returns a list of parameters"""
+        self.z = self._next_sample()
+        self.solutions = self.mean + self.sigma * np.sqrt(self.diag_c) * self.z
+        return self.solutions
+
+    def tell(self, reward_table_result):
+        assert (len(reward_table_result) == self.popsize), "Inconsistent reward_table size reported."
+        reward_table = np.array(reward_table_result)
+        if self.weight_decay > 0:
+            l2_decay = compute_weight_decay(self.weight_decay, self.solutions)
+            reward_table += l2_decay
+
+        idx = np.argsort(reward_table)[::-1]
+        self.curr_best_reward = reward_table[idx[0]]
+        if self.curr_best_reward > self.best_reward:
+            self.best_reward = self.curr_best_reward
+            self.best_mu = np.copy(self.solutions[idx[0]])
+
+        self.t += 1
+        sqrt_c = np.sqrt(self.diag_c)
+        z_w = np.dot(self.weights, self.z[idx[:self.mu]])
+        y_w = sqrt_c * z_w
+        self.mean += self.sigma * y_w
+
+        self.ps = (1.0 - self.cs) * self.ps + np.sqrt(self.cs * (2.0 - self.cs) * self.mueff) * z_w
+        ps_norm = np.linalg.norm(self.ps)
+        h_sigma = ps_norm / np.sqrt(1.0 - (1.0 - self.cs) ** (2 * self.t)) / self.chi_n < \
+            1.4 + 2.0 / (self.num_params + 1.0)
+        self.pc = (1.0 - self.cc) * self.pc + h_sigma * np.sqrt(self.cc * (2.0 - self.cc) * self.mueff) * y_w
+
+        y_sel = sqrt_c * self.z[idx[:self.mu]]
+        self.diag_c = (1.0 - self.c1 - self.cmu + (1 - h_sigma) * self.c1 * self.cc * (2.0 - self.cc)) * \
+            self.diag_c + self.c1 * self.pc * self.pc + self.cmu * np.dot(self.weights, y_sel * y_sel)
+        self.sigma *= np.exp((self.cs / self.damps) * (ps_norm / self.chi_n - 1.0))
+
+    def current_param(self):
+        return self.mean
+
+    def set_mu(self, mu):
+        self.mean = np.array(mu)
+
+    def inject(self, param, reward):
+        """adopts a solution evaluated elsewhere (e.g., on another island) as mean, if better than the current best"""
+        if reward > self.curr_best_reward:
+            self.set_mu(param)
+
+    def best_param(self):
+        return self.best_mu
+
+    def result(self):  # return best params so far, along with historically best reward, curr reward, sigma
+        return self.best_mu, self.best_reward, self.curr_best_reward, self.sigma
+
+
+class LMMAES(SampleAhead):
+    """Limited-memory matrix adaptation ES (Loshchilov, Glasmachers and Beyer, 2017): the covariance is implicitly
+    represented by m = O(log d) direction vectors, for O(m d) time and memory per sample."""
+
+    def __init__(self, num_params,  # number of model parameters
+                 sigma_init=0.10,  # initial standard deviation
+                 popsize=256,  # population size
+                 memory_size=None,  # number of direction vectors, defaults to 4 + 3 ln(d)
+                 weight_decay=0.01):  # weight decay coefficient
+
+        self.num_params = num_params
+        self.sigma_init = sigma_init
+        self.popsize = popsize
+        self.weight_decay = weight_decay
+
+        n = self.num_params
+        self.memory_size = memory_size if memory_size is not None else 4 + int(np.floor(3 * np.log(n)))
+        self.weights, self.mueff = compute_recombination_weights(self.popsize)
+        self.mu = len(self.weights)
+        # the step sizes of the paper exceed 1 when d is small compared to the population, hence the clipping
+        self.cs = min(1.0, 2.0 * self.popsize / n)
+        j = np.arange(self.memory_size)
+        self.cd = np.minimum(1.0, 1.0 / (1.5 ** j * n))
+        self.cc = np.minimum(1.0, self.popsize / (4.0 ** j * n))
+
+        self.mean = np.zeros(n)
+        self.sigma = self.sigma_init
+        self.ps = np.zeros(n)
+        self.directions = np.zeros((self.memory_size, n))
+        self.t = 0
+        self.z = None
+        self.d = None
+        self.solutions = None
+        self.best_mu = np.zeros(n)
+        self.best_reward = float("-inf")
+        self.curr_best_reward = float("-inf")
+
+    def rms_stdev(self):
+        return self.sigma
+
+    def _sample(self):
+        return np.random.randn(self.popsize, self.num_params)
+
+    def ask(self):
+        """returns a list of parameters"""
+        self.z = self._next_sample()
+        self.d = np.copy(self.z)
+        for j in range(min(self.t, self.memory_size)):
+            projection = np.dot(self.d, self.directions[j])
+            self.d *= 1.0 - self.cd[j]
+            self.d += self.cd[j] * np.outer(projection, self.directions[j])
+        self.solutions = self.mean + self.sigma * self.d
+        return self.solutions
+
+    def tell(self, reward_table_result):
+        assert (len(reward_table_result) == self.popsize), "Inconsistent reward_table size reported."
+        reward_table = np.array(reward_table_result)
+        if self.weight_decay > 0:
+            l2_decay = compute_weight_decay(self.weight_decay, self.solutions)
+            reward_table += l2_decay
+
+        idx = np.argsort(reward_table)[::-1]
+        self.curr_best_reward = reward_table[idx[0]]
+        if self.curr_best_reward > self.best_reward:
+            self.best_reward = self.curr_best_reward
+            self.best_mu = np.copy(self.solutions[idx[0]])
+
+        z_w = np.dot(self.weights, self.z[idx[:self.mu]])
+        self.mean += self.sigma * np.dot(self.weights, self.d[idx[:self.mu]])
+        self.ps = (1.0 - self.cs) * self.ps + np.sqrt(self.mueff * self.cs * (2.0 - self.cs)) * z_w
+        self.directions *= (1.0 - self.cc)[:, None]
+        self.directions += np.sqrt(self.mueff * self.cc * (2.0 - self.cc))[:, None] * z_w[None, :]
+        self.sigma *= np.exp(self.cs / 2.0 * (np.dot(self.ps, self.ps) / self.num_params - 1.0))
+        self.t += 1
+
+    def current_param(self):
+        return self.mean
+
+    def set_mu(self, mu):
+        self.mean = np.array(mu)
+
+    def inject(self, param, reward):
+        """adopts a solution evaluated elsewhere (e.g., on another island) as mean, if better than the current best"""
+        if reward > self.curr_best_reward:
+            self.set_mu(param)
+
+    def best_param(self):
+        return self.best_mu
+
+    def result(self):  # return best params so far, along with historically best reward, curr reward, sigma
+        return self.best_mu, self.best_reward, self.curr_best_reward, self.sigma
+
+
+class SimpleGA(SampleAhead):
     """Simple Genetic Algorithm."""
 
     def __init__(self, num_params,  # number of model parameters
@@ -150,6 +524,7 @@ class SimpleGA(object):
                  elite_ratio=0.1,  # percentage of the elites
                  forget_best=False,  # forget the historical best elites
                  weight_decay=0.01,  # weight decay coefficient
+                 dtype=np.float64,  # of the parameters
                  ):
 
         self.num_params = num_params
@@ -162,9 +537,15 @@ class SimpleGA(object):
         self.elite_popsize = int(self.popsize * self.elite_ratio)
 
         self.sigma = self.sigma_init
-        self.elite_params = np.zeros((self.elite_popsize, self.num_params))
-        self.elite_rewards = np.zeros(self.elite_popsize)
-        self.best_param = np.zeros(self.num_params)
+        self.dtype = np.dtype(dtype)
+        # candidates and elites share one buffer, so that tell selects among both without concatenating
+        self._params = np.zeros((self.popsize + self.elite_popsize, self.num_params), dtype=self.dtype)
+        self._rewards = np.zeros(self.popsize + self.elite_popsize)
+        self._mates = np.empty((self.popsize, self.num_params), dtype=self.dtype)
+        self.solutions = self._params[:self.popsize]
+        self.elite_params = self._params[self.popsize:]
+        self.elite_rewards = self._rewards[self.popsize:]
+        self.best_param = np.zeros(self.num_params, dtype=self.dtype)
         self.best_reward = 0
         self.first_iteration = True
         self.forget_best = forget_best
@@ -173,31 +554,25 @@ class SimpleGA(object):
     def rms_std(self):
         return self.sigma  # same sigma for all parameters.
 
+    def _sample(self):
+        parents = np.random.randint(self.elite_popsize, size=(2, self.popsize))
+        mask = np.random.randint(2, size=(self.popsize, self.num_params), dtype=bool)
+        return parents, mask, np.random.randn(self.popsize, self.num_params).astype(self.dtype, copy=False)
+
     def ask(self):
-        """returns a list of parameters"""
-        self.epsilon = np.random.randn(self.popsize, self.num_params) * self.sigma
+        """returns a list of parameters, valid until the next call"""
         if self.first_iteration:
-            self.solutions = np.random.random((self.popsize, self.num_params)) * 2.0 - 1.0
+            self.solutions[:] = np.random.random((self.popsize, self.num_params)) * 2.0 - 1.0
             return self.solutions
-        solutions = []
-
-        def mate(a, b):
-            c = np.copy(a)
-            idx = np.where(np.random.rand(c.size) > 0.5)
-            c[idx] = b[idx]
-            return c
-
-        elite_range = range(self.elite_popsize)
-        for i in range(self.popsize):
-            idx_a = np.random.choice(elite_range)
-            idx_b = np.random.choice(elite_range)
-            child_params = mate(self.elite_params[idx_a], self.elite_params[idx_b])
-            solutions.append(child_params + self.epsilon[i])
-
-        solutions = np.array(solutions)
-        self.solutions = solutions
-
-        return solutions
+        parents, mask, self.epsilon = self._next_sample()
+        # uniform crossover between two elites drawn with replacement, for all children at once
+        np.take(self.elite_params, parents[0], axis=0, out=self.solutions)
+        np.take(self.elite_params, parents[1], axis=0, out=self._mates)
+        np.copyto(self.solutions, self._mates, where=mask)
+        # gaussian mutation
+        self.epsilon *= self.sigma
+        self.solutions += self.epsilon
+        return self.solutions
 
     def tell(self, reward_table_result):
         # input must be a numpy float array
@@ -209,17 +584,16 @@ class SimpleGA(object):
             l2_decay = compute_weight_decay(self.weight_decay, self.solutions)
             reward_table += l2_decay
 
+        self._rewards[:self.popsize] = reward_table
         if self.forget_best or self.first_iteration:
-            reward = reward_table
-            solution = self.solutions
+            n_candidates = self.popsize
         else:
-            reward = np.concatenate([reward_table, self.elite_rewards])
-            solution = np.concatenate([self.solutions, self.elite_params])
+            n_candidates = self.popsize + self.elite_popsize
 
-        idx = np.argsort(reward)[::-1][0:self.elite_popsize]
+        idx = np.argsort(self._rewards[:n_candidates])[::-1][0:self.elite_popsize]
 
-        self.elite_rewards = reward[idx]
-        self.elite_params = solution[idx]
+        self.elite_rewards[:] = self._rewards[idx]
+        self.elite_params[:] = self._params[idx]
 
         self.curr_best_reward = self.elite_rewards[0]
 
@@ -232,11 +606,17 @@ class SimpleGA(object):
             self.sigma *= self.sigma_decay
 
     def current_param(self):
-        return self.elite_params[0]
+        return np.copy(self.elite_params[0])
 
     def set_mu(self, mu):
         pass
 
+    def inject(self, param, reward):
+        """replaces the worst elite with a solution evaluated elsewhere (e.g., on another island), if better"""
+        if reward > self.elite_rewards[-1]:
+            self.elite_params[-1] = param
+            self.elite_rewards[-1] = reward
+
     def best_param(self):
         return self.best_param
 
@@ -244,7 +624,7 @@ class SimpleGA(object):
         return self.best_param, self.best_reward, self.curr_best_reward, self.sigma
 
 
-class OpenES(object):
+class OpenES(SampleAhead):
     """ Basic Version of OpenAI Evolution Strategies."""
 
     def __init__(self, num_params,  # number of model parameters
@@ -258,9 +638,12 @@ class OpenES(object):
                  antithetic=False,  # whether to use antithetic sampling
                  weight_decay=0.01,  # weight decay coefficient
                  rank_fitness=True,  # use rank rather than fitness numbers
-                 forget_best=True):  # forget historical best
+                 forget_best=True,  # forget historical best
+                 noise_table=None,  # if given, sample perturbations as offsets into a SharedNoiseTable
+                 dtype=np.float64):  # of the parameters
 
         self.num_params = num_params
+        self.dtype = np.dtype(dtype)
         self.sigma_decay = sigma_decay
         self.sigma = sigma_init
         self.sigma_init = sigma_init
@@ -275,8 +658,8 @@ class OpenES(object):
             self.half_popsize = int(self.popsize / 2)
 
         self.reward = np.zeros(self.popsize)
-        self.mu = np.zeros(self.num_params)
-        self.best_mu = np.zeros(self.num_params)
+        self.mu = np.zeros(self.num_params, dtype=self.dtype)
+        self.best_mu = np.zeros(self.num_params, dtype=self.dtype)
         self.best_reward = 0
         self.first_iteration = True
         self.forget_best = forget_best
@@ -284,6 +667,7 @@ class OpenES(object):
         self.rank_fitness = rank_fitness
         if self.rank_fitness:
             self.forget_best = True  # always forget the best one if we rank
+        self.noise_table = noise_table
         # choose optimizer
         self.optimizer = Adam(self, learning_rate)
 
@@ -291,21 +675,53 @@ class OpenES(object):
         sigma = self.sigma
         return np.mean(np.sqrt(sigma * sigma))
 
+    def _sample(self):
+        n = self.half_popsize if self.antithetic else self.popsize
+        if self.noise_table is not None:
+            return self.noise_table.sample_offsets(n, self.num_params)
+        return np.random.randn(n, self.num_params).astype(self.dtype, copy=False)
+
     def ask(self):
         """returns a list of parameters"""
+        if self.noise_table is not None:
+            return self._ask_noise_table()
         # antithetic sampling
         if self.antithetic:
-            self.epsilon_half = np.random.randn(self.half_popsize, self.num_params)
+            self.epsilon_half = self._next_sample()
             self.epsilon = np.concatenate([self.epsilon_half, - self.epsilon_half])
         else:
-            self.epsilon = np.random.randn(self.popsize, self.num_params)
+            self.epsilon = self._next_sample()
 
         if self.first_iteration:
-            self.solutions = np.random.random((self.popsize, self.num_params)) * 2 - 1.0
+            self.solutions = (np.random.random((self.popsize, self.num_params)) * 2 - 1.0).astype(self.dtype,
+                                                                                                   copy=False)
         else:
             self.solutions = self.mu.reshape(1, self.num_params) + self.epsilon * self.sigma
         return self.solutions
 
+    def _ask_noise_table(self):
+        if self.antithetic:
+            offsets = self._next_sample()
+            self.offsets = np.concatenate([offsets, offsets])
+            self.signs = np.concatenate([np.ones(self.half_popsize), - np.ones(self.half_popsize)])
+        else:
+            self.offsets = self._next_sample()
+            self.signs = np.ones(self.popsize)
+
+        if self.first_iteration:
+            self.solutions = (np.random.random((self.popsize, self.num_params)) * 2 - 1.0).astype(self.dtype,
+                                                                                                   copy=False)
+        else:
+            self.solutions = np.array([self.noise_table.perturb(self.mu, self.sigma, offset, sign)
+                                       for offset, sign in zip(self.offsets, self.signs)])
+        return self.solutions
+
+    def get_perturbations(self):
+        """Returns mu, sigma, offsets and signs the last solutions were built from, None if not from the table."""
+        if self.noise_table is None or self.first_iteration:
+            return None
+        return self.mu, self.sigma, self.offsets, self.signs
+
     def tell(self, reward_table_result):
         # input must be a numpy float array
         assert (len(reward_table_result) == self.popsize), "Inconsistent reward_table size reported."
@@ -339,7 +755,11 @@ class OpenES(object):
         # main bit:
         # standardize the rewards to have a gaussian distribution
         normalized_reward = (reward - np.mean(reward)) / np.std(reward)
-        change_mu = 1. / (self.popsize * self.sigma) * np.dot(self.epsilon.T, normalized_reward)
+        if self.noise_table is not None:
+            change_mu = 1. / (self.popsize * self.sigma) * self.noise_table.weighted_sum(
+                normalized_reward * self.signs, self.offsets, self.num_params)
+        else:
+            change_mu = 1. / (self.popsize * self.sigma) * np.dot(self.epsilon.T, normalized_reward)
 
         # self.mu += self.learning_rate * change_mu
 
@@ -357,7 +777,12 @@ class OpenES(object):
         return self.curr_best_mu
 
     def set_mu(self, mu):
-        self.mu = np.array(mu)
+        self.mu = np.array(mu, dtype=self.dtype)
+
+    def inject(self, param, reward):
+        """adopts a solution evaluated elsewhere (e.g., on another island) as mean, if better than the current best"""
+        if reward > self.curr_best_reward:
+            self.set_mu(param)
 
     def best_param(self):
         return self.best_mu
@@ -366,7 +791,7 @@ class OpenES(object):
         return self.best_mu, self.best_reward, self.curr_best_reward, self.sigma
 
 
-class PEPG(object):
+class PEPG(SampleAhead):
     """Extension of PEPG with bells and whistles."""
 
     def __init__(self, num_params,  # number of model parameters
@@ -383,9 +808,12 @@ class PEPG(object):
                  average_baseline=True,  # set baseline to average of batch
                  weight_decay=0.01,  # weight decay coefficient
                  rank_fitness=True,  # use rank rather than fitness numbers
-                 forget_best=True):  # don't keep the historical best solution
+                 forget_best=True,  # don't keep the historical best solution
+                 noise_table=None,  # if given, sample perturbations as offsets into a SharedNoiseTable
+                 dtype=np.float64):  # of the parameters
 
         self.num_params = num_params
+        self.dtype = np.dtype(dtype)
         self.sigma_init = sigma_init
         self.sigma_alpha = sigma_alpha
         self.sigma_decay = sigma_decay
@@ -412,16 +840,17 @@ class PEPG(object):
 
         self.forget_best = forget_best
         self.batch_reward = np.zeros(self.batch_size * 2)
-        self.mu = np.zeros(self.num_params)
-        self.sigma = np.ones(self.num_params) * self.sigma_init
-        self.curr_best_mu = np.zeros(self.num_params)
-        self.best_mu = np.zeros(self.num_params)
+        self.mu = np.zeros(self.num_params, dtype=self.dtype)
+        self.sigma = np.ones(self.num_params, dtype=self.dtype) * self.sigma_init
+        self.curr_best_mu = np.zeros(self.num_params, dtype=self.dtype)
+        self.best_mu = np.zeros(self.num_params, dtype=self.dtype)
         self.best_reward = 0
         self.first_iteration = True
         self.weight_decay = weight_decay
         self.rank_fitness = rank_fitness
         if self.rank_fitness:
             self.forget_best = True  # always forget the best one if we rank
+        self.noise_table = noise_table
         # choose optimizer
         self.optimizer = Adam(self, learning_rate)
 
@@ -431,18 +860,43 @@ class PEPG(object):
 
     def ask(self):
         """returns a list of parameters"""
+        if self.noise_table is not None:
+            return self._ask_noise_table()
         # antithetic sampling
-        self.epsilon = np.random.randn(self.batch_size, self.num_params) * self.sigma.reshape(1, self.num_params)
+        self.epsilon = self._next_sample() * self.sigma.reshape(1, self.num_params)
         self.epsilon_full = np.concatenate([self.epsilon, - self.epsilon])
         if self.average_baseline:
             epsilon = self.epsilon_full
         else:
             # first population is mu, then positive epsilon, then negative epsilon
-            epsilon = np.concatenate([np.zeros((1, self.num_params)), self.epsilon_full])
+            epsilon = np.concatenate([np.zeros((1, self.num_params), dtype=self.dtype), self.epsilon_full])
         solutions = self.mu.reshape(1, self.num_params) + epsilon
         self.solutions = solutions
         return solutions
 
+    def _ask_noise_table(self):
+        # antithetic sampling, the first population is mu (sign 0) if it is the baseline
+        offsets = self._next_sample()
+        self.offsets = np.concatenate([offsets, offsets])
+        self.signs = np.concatenate([np.ones(self.batch_size), - np.ones(self.batch_size)])
+        if not self.average_baseline:
+            self.offsets = np.concatenate([[0], self.offsets])
+            self.signs = np.concatenate([[0], self.signs])
+        self.solutions = np.array([self.noise_table.perturb(self.mu, self.sigma, offset, sign)
+                                   for offset, sign in zip(self.offsets, self.signs)])
+        return self.solutions
+
+    def _sample(self):
+        if self.noise_table is not None:
+            return self.noise_table.sample_offsets(self.batch_size, self.num_params)
+        return np.random.randn(self.batch_size, self.num_params).astype(self.dtype, copy=False)
+
+    def get_perturbations(self):
+        """Returns mu, sigma, offsets and signs the last solutions were built from, None if not from the table."""
+        if self.noise_table is None:
+            return None
+        return self.mu, self.sigma, self.offsets, self.signs
+
     def tell(self, reward_table_result):
         # input must be a numpy float array
         assert (len(reward_table_result) == self.popsize), "Inconsistent reward_table size reported."
@@ -471,7 +925,7 @@ class PEPG(object):
 
         best_reward = reward[idx[0]]
         if best_reward > b or self.average_baseline:
-            best_mu = self.mu + self.epsilon_full[idx[0]]
+            best_mu = self.solutions[reward_offset + idx[0]].copy()
             best_reward = reward[idx[0]]
         else:
             best_mu = self.mu
@@ -481,7 +935,7 @@ class PEPG(object):
         self.curr_best_mu = best_mu
 
         if self.first_iteration:
-            self.sigma = np.ones(self.num_params) * self.sigma_init
+            self.sigma = np.ones(self.num_params, dtype=self.dtype) * self.sigma_init
             self.first_iteration = False
             self.best_reward = self.curr_best_reward
             self.best_mu = best_mu
@@ -491,17 +945,28 @@ class PEPG(object):
                 self.best_reward = self.curr_best_reward
 
         # short hand
-        epsilon = self.epsilon
         sigma = self.sigma
+        if self.noise_table is not None:
+            # noise slices of the positive half, each epsilon is sigma * noise
+            offsets = self.offsets[reward_offset:reward_offset + self.batch_size]
+        else:
+            epsilon = self.epsilon
 
         # update the mean
 
         # move mean to the average of the best idx means
         if self.use_elite:
-            self.mu += self.epsilon_full[idx].mean(axis=0)
+            if self.noise_table is not None:
+                self.mu += sigma * self.noise_table.weighted_sum(self.signs[reward_offset + idx] / len(idx),
+                                                                 self.offsets[reward_offset + idx], self.num_params)
+            else:
+                self.mu += self.epsilon_full[idx].mean(axis=0)
         else:
             rT = (reward[:self.batch_size] - reward[self.batch_size:])
-            change_mu = np.dot(rT, epsilon)
+            if self.noise_table is not None:
+                change_mu = sigma * self.noise_table.weighted_sum(rT, offsets, self.num_params)
+            else:
+                change_mu = np.dot(rT, epsilon)
             self.optimizer.stepsize = self.learning_rate
             update_ratio = self.optimizer.update(-change_mu)  # adam, rmsprop, momentum, etc.
             # self.mu += (change_mu * self.learning_rate) # normal SGD method
@@ -512,10 +977,16 @@ class PEPG(object):
             stdev_reward = 1.0
             if not self.rank_fitness:
                 stdev_reward = reward.std()
-            s = ((epsilon * epsilon - (sigma * sigma).reshape(1, self.num_params)) / sigma.reshape(1, self.num_params))
             reward_avg = (reward[:self.batch_size] + reward[self.batch_size:]) / 2.0
             r_s = reward_avg - b
-            delta_sigma = (np.dot(r_s, s)) / (2 * self.batch_size * stdev_reward)
+            if self.noise_table is not None:
+                # (epsilon^2 - sigma^2) / sigma = sigma * (noise^2 - 1)
+                delta_sigma = sigma * (self.noise_table.weighted_sum(r_s, offsets, self.num_params, power=2) -
+                                       np.sum(r_s)) / (2 * self.batch_size * stdev_reward)
+            else:
+                s = ((epsilon * epsilon - (sigma * sigma).reshape(1, self.num_params)) /
+                     sigma.reshape(1, self.num_params))
+                delta_sigma = (np.dot(r_s, s)) / (2 * self.batch_size * stdev_reward)
 
             # adjust sigma according to the adaptive sigma calculation
             # for stability, don't let sigma move more than 10% of orig value
@@ -534,7 +1005,12 @@ class PEPG(object):
         return self.curr_best_mu
 
     def set_mu(self, mu):
-        self.mu = np.array(mu)
+        self.mu = np.array(mu, dtype=self.dtype)
+
+    def inject(self, param, reward):
+        """adopts a solution evaluated elsewhere (e.g., on another island) as mean, if better than the current best"""
+        if reward > self.curr_best_reward:
+            self.set_mu(param)
 
     def best_param(self):
         return self.best_mu
@@ -0,0 +1,155 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import yaml
+
+from aggregate import parse_run_keys
+from controllers import BaseController
+from simulation import parallel_wrapper, set_start_method
+from utils import set_seed
+
+HEADER = ["size", "solver", "seed", "task", "brain", "best", "condition", "fitness", "steps", "rollout.sec", "error"]
+
+
+def load_grid_jobs(output_dir):
+    """The task, body and config overrides of every experiment run by grid.py, by size and file name, since file names
+    only have the first part of the task (e.g., hilly for hilly-3-10) and nothing of the body."""
+    jobs = {}
+    for manifest_file in sorted(glob.glob(os.path.join(output_dir, "grids", "*.json"))):
+        with open(manifest_file, "r") as file:
+            for job in json.load(file)["jobs"]:
+                jobs[(job["size"], job["file"])] = job
+    return jobs
+
+
+def create_evaluations(config, best_files, conditions, jobs):
+    """One evaluation per best and condition; the config of each is config.yaml, updated with what is known of the
+    experiment that saved the best and then with the condition."""
+    evaluations = []
+    for best_file in best_files:
+        keys = parse_run_keys(best_file)
+        if keys["seed"] is None:
+            logging.warning("skipping {}, not named as main.py names bests".format(best_file))
+            continue
+        # the file has the first part of the task only, the rest (e.g., 3-10 of hilly-3-10) is that of config.yaml
+        task = config["task"] if config["task"].split("-")[0] == keys["task"] else keys["task"]
+        run_config = dict(config, size=keys["size"], solver=keys["solver"], seed=keys["seed"], task=task,
+                          brain=keys["brain"], save_video=0)
+        job = jobs.get((keys["size"], os.path.splitext(os.path.basename(best_file))[0]))
+        if job is not None:
+            run_config.update(**job.get("config", {}))
+            run_config.update(**{key: job[key] for key in ["task", "n_masses", "r", "mass"]})
+            run_config["save_video"] = 0
+        for condition in conditions:
+            condition = dict(condition)
+            name = str(condition.pop("name"))
+            evaluations.append({"best": best_file, "condition": name, "keys": keys,
+                                "config": dict(run_config, **condition)})
+    return evaluations
+
+
+def read_done(file_name):
+    """The (best, condition) pairs already evaluated in a results table. The rows of failed evaluations are dropped
+    from the table, so that they are tried again."""
+    if not os.path.isfile(file_name):
+        return set()
+    with open(file_name, "r") as file:
+        header = file.readline().rstrip("\n").split(";")
+        rows = [line.rstrip("\n").split(";") for line in file if line.strip()]
+    # a row cut short by an interruption counts as not done
+    rows = [row for row in rows if len(row) == len(header) and row[header.index("error")] == "None"]
+    with open(file_name + ".tmp", "w") as file:
+        file.write("".join([";".join(row) + "\n" for row in [header] + rows]))
+    os.replace(file_name + ".tmp", file_name)
+    return set((row[header.index("best")], row[header.index("condition")]) for row in rows)
+
+
+def evaluation_wrapper(args):
+    config, best_file, i = args
+    try:
+        solution = np.load(best_file)
+        config["n_masses"] = int(config["n_masses"])
+        config["r"] = float(config["r"])
+        config["mass"] = float(config["mass"])
+        config["n_params"] = BaseController.get_number_of_params_for_controller(config)
+        if len(solution) != config["n_params"]:
+            raise ValueError("Invalid best: {} parameters instead of {}".format(len(solution), config["n_params"]))
+        # as in best mode, and so that terrains drawn at random are the same for every condition
+        set_seed(config["seed"])
+        _, fitness, telemetry = parallel_wrapper((config, solution, i))
+    except Exception as e:
+        return i, None, None, repr(e)
+    return i, fitness, telemetry, None
+
+
+def evaluate(evaluations, file_name, num_workers, progress_interval, config):
+    """Evaluates all the given evaluations whose best and condition are not in the table yet, on num_workers workers,
+    appending a row for each as soon as it is done (in the order they finish), and logging the progress every
+    progress_interval seconds; returns the number of evaluations that failed."""
+    done = read_done(file_name)
+    evaluations = [evaluation for evaluation in evaluations if (evaluation["best"], evaluation["condition"]) not in done]
+    logging.warning("{} evaluations to go, {} already done".format(len(evaluations), len(done)))
+    if not os.path.isdir(os.path.dirname(file_name)):
+        os.makedirs(os.path.dirname(file_name))
+    if not os.path.isfile(file_name):
+        with open(file_name, "w") as file:
+            file.write(";".join(HEADER) + "\n")
+    set_start_method(config)
+    num_failed = 0
+    start_time = last_time = time.time()
+    with Pool(num_workers) as pool, open(file_name, "a") as file:
+        results = pool.imap_unordered(evaluation_wrapper, [(evaluation["config"], evaluation["best"], i)
+                                                           for i, evaluation in enumerate(evaluations)], chunksize=1)
+        for count, (i, fitness, telemetry, error) in enumerate(results, start=1):
+            evaluation = evaluations[i]
+            keys = evaluation["keys"]
+            row = [keys["size"], keys["solver"], keys["seed"], evaluation["config"]["task"], keys["brain"],
+                   evaluation["best"], evaluation["condition"], fitness, telemetry["steps"] if telemetry else None,
+                   telemetry["rollout.sec"] if telemetry else None, error.replace(";", ",") if error else None]
+            file.write(";".join([str(value) for value in row]) + "\n")
+            # a row is only counted as done once it is on disk
+            file.flush()
+            num_failed += error is not None
+            if time.time() - last_time >= progress_interval or count == len(evaluations):
+                last_time = time.time()
+                rate = count / (last_time - start_time)
+                logging.warning("evaluated {}/{} ({} failed), {:.2f} per sec, {:.0f} sec to go".format(
+                    count, len(evaluations), num_failed, rate, (len(evaluations) - count) / rate))
+    return num_failed
+
+
+def get_evaluation_file_name(name):
+    return ".".join([os.path.join(os.getcwd(), "output", "evaluations", name), "txt"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="evaluates many saved bests, under one or more conditions, on a pool "
+                                                 "of workers, and writes the fitness of each to one table")
+    parser.add_argument("--bests", default=os.path.join("output", "*", "bests", "*.npy"), help="glob of the bests")
+    parser.add_argument("--conditions", default=None, help="yaml list of config overrides, each with a name (e.g., "
+                                                           "- {name: heavy, mass: 150}); only config.yaml if none")
+    parser.add_argument("--name", default="bests", help="results go to output/evaluations/<name>.txt")
+    parser.add_argument("--output", default="output", help="the directory with the grids/ manifests, if any")
+    parser.add_argument("--np", type=int, default=None, help="workers, np of config.yaml if none")
+    parser.add_argument("--progress", type=float, default=10.0, help="seconds between progress reports")
+    args = parser.parse_args()
+    sys.argv = sys.argv[:1]
+    with open("config.yaml", "r") as yaml_file:
+        base_config = yaml.load(yaml_file, Loader=yaml.FullLoader)
+    if args.conditions is not None:
+        with open(args.conditions, "r") as yaml_file:
+            base_conditions = yaml.load(yaml_file, Loader=yaml.FullLoader)
+    else:
+        base_conditions = [{"name": "default"}]
+    all_evaluations = create_evaluations(base_config, sorted(glob.glob(args.bests)), base_conditions,
+                                         load_grid_jobs(args.output))
+    failed = evaluate(all_evaluations, get_evaluation_file_name(args.name), args.np or base_config["np"],
+                      args.progress, base_config)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,156 @@
+import argparse
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+import yaml
+
+from controllers import BaseController
+from utils import random_solution, set_seed
+
+QUANTITIES = ["positions", "pressure", "obs", "actions"]
+
+
+class RecordingController(object):
+    """Wraps a controller to record the observations it receives and the actions it returns."""
+
+    def __init__(self, controller, trajectory):
+        self.controller = controller
+        self.trajectory = trajectory
+
+    def control(self, t, obs):
+        action = self.controller.control(t, obs)
+        self.trajectory["obs"].append(np.array(obs, dtype=np.float64))
+        self.trajectory["actions"].append(np.array(action, dtype=np.float64))
+        return action
+
+
+def simulate_trajectory(config, solution):
+    """Runs a headless episode and returns, for every step, the positions of the masses, the pressure, the
+    observations and the actions, and the fitness at the end."""
+    # Box2D's example framework parses sys.argv when imported, so it is only imported once the arguments are parsed
+    from simulators import NoRenderSimulator
+    # tasks may draw their terrain at random
+    set_seed(config["seed"])
+    framework = NoRenderSimulator(config, solution)
+    trajectory = {quantity: [] for quantity in QUANTITIES}
+    framework.controller = RecordingController(framework.controller, trajectory)
+    while framework.should_step():
+        framework.step()
+        trajectory["positions"].append([(mass.position.x, mass.position.y) for mass in framework.morphology.masses])
+        trajectory["pressure"].append(framework.morphology.pressure.current)
+    fitness = framework.env.get_fitness(framework.morphology, config["timesteps"])
+    framework.reset()
+    trajectory = {quantity: np.array(values, dtype=np.float64) for quantity, values in trajectory.items()}
+    return trajectory, fitness
+
+
+def get_case_config(config, task, brain, n_masses, seed, timesteps):
+    config = dict(config, task=task, brain=brain, n_masses=n_masses, seed=seed, timesteps=timesteps, save_video=0)
+    config["n_params"] = BaseController.get_number_of_params_for_controller(config)
+    return config
+
+
+def get_case_file_name(golden_dir, config):
+    return os.path.join(golden_dir, ".".join([config["task"], config["brain"], str(config["n_masses"]),
+                                              str(config["seed"]), "npz"]))
+
+
+def record(config, golden_dir):
+    """Stores the trajectory of the current implementation, with the config and solution that produced it."""
+    set_seed(config["seed"])
+    solution = random_solution(config)
+    trajectory, fitness = simulate_trajectory(config, solution)
+    if not os.path.isdir(golden_dir):
+        os.makedirs(golden_dir)
+    np.savez_compressed(get_case_file_name(golden_dir, config), config=json.dumps(config), solution=solution,
+                        fitness=fitness, **trajectory)
+    return len(trajectory["positions"]), fitness
+
+
+def check(file_name, tolerances):
+    """Re-runs a recorded case and returns None if every quantity is within its (rtol, atol) of the reference,
+    otherwise the first diverging step, quantity, index and values."""
+    with np.load(file_name) as data:
+        config = json.loads(str(data["config"]))
+        solution = data["solution"]
+        reference = {quantity: data[quantity] for quantity in QUANTITIES + ["fitness"]}
+    trajectory, fitness = simulate_trajectory(config, solution)
+    divergence = None
+    for quantity in QUANTITIES:
+        old, new = reference[quantity], trajectory[quantity]
+        length = min(len(old), len(new))
+        rtol, atol = tolerances[quantity]
+        close = np.isclose(new[:length], old[:length], rtol=rtol, atol=atol).reshape(length, -1)
+        steps = np.flatnonzero(~ np.all(close, axis=1))
+        if len(steps):
+            step = steps[0]
+            index = int(np.flatnonzero(~ close[step])[0])
+            found = {"step": int(step), "quantity": quantity, "index": index,
+                     "reference": float(old[step].ravel()[index]), "value": float(new[step].ravel()[index])}
+        elif len(old) != len(new):
+            found = {"step": length, "quantity": quantity, "index": None, "reference": len(old), "value": len(new)}
+        else:
+            continue
+        if divergence is None or found["step"] < divergence["step"]:
+            divergence = found
+    rtol, atol = tolerances["fitness"]
+    if divergence is None and not np.isclose(fitness, reference["fitness"], rtol=rtol, atol=atol):
+        divergence = {"step": len(trajectory["positions"]), "quantity": "fitness", "index": None,
+                      "reference": float(reference["fitness"]), "value": float(fitness)}
+    return divergence
+
+
+def parse_tolerances(rtol, atol, overrides):
+    """Overrides look like quantity=rtol,atol (e.g., obs=1e-5,1e-6)."""
+    tolerances = {quantity: (rtol, atol) for quantity in QUANTITIES + ["fitness"]}
+    for override in overrides:
+        quantity, values = override.split("=")
+        if quantity not in tolerances:
+            raise ValueError("Invalid quantity: {}".format(quantity))
+        tolerances[quantity] = tuple(float(value) for value in values.split(","))
+    return tolerances
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="records reference trajectories of the simulation and checks the "
+                                                 "current implementation against them")
+    parser.add_argument("command", choices=["record", "check"])
+    parser.add_argument("--dir", default=os.path.join("output", "golden"))
+    parser.add_argument("--tasks", nargs="+", default=["flat", "hilly-3-10", "escape", "climber", "cave", "carrier"])
+    parser.add_argument("--brains", nargs="+", default=["phase", "mlp"])
+    parser.add_argument("--n-masses", nargs="+", type=int, default=[20])
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0, 1])
+    parser.add_argument("--timesteps", type=int, default=600)
+    parser.add_argument("--rtol", type=float, default=1e-7)
+    parser.add_argument("--atol", type=float, default=1e-9)
+    parser.add_argument("--tolerance", nargs="*", default=[], help="per quantity, e.g. obs=1e-5,1e-6")
+    args = parser.parse_args()
+    sys.argv = sys.argv[:1]
+    if args.command == "record":
+        with open("config.yaml", "r") as yaml_file:
+            base_config = yaml.load(yaml_file, Loader=yaml.FullLoader)
+        for task in args.tasks:
+            for brain in args.brains:
+                for n in args.n_masses:
+                    for seed in args.seeds:
+                        case_config = get_case_config(base_config, task, brain, n, seed, args.timesteps)
+                        steps, value = record(case_config, args.dir)
+                        print("{}: {} steps, fitness {}".format(get_case_file_name(args.dir, case_config), steps,
+                                                               value))
+    else:
+        tolerances = parse_tolerances(args.rtol, args.atol, args.tolerance)
+        num_diverged = 0
+        for case_file in sorted(glob.glob(os.path.join(args.dir, "*.npz"))):
+            result = check(case_file, tolerances)
+            if result is None:
+                print("{}: ok".format(case_file))
+                continue
+            num_diverged += 1
+            print("{}: {} diverges at step {} (index {}): {} instead of {}".format(
+                case_file, result["quantity"], result["step"], result["index"], result["value"],
+                result["reference"]))
+        print("{} cases diverged".format(num_diverged))
+        sys.exit(1 if num_diverged else 0)
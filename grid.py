@@ -0,0 +1,173 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import yaml
+
+from controllers import BaseController
+from listener import FileListener
+from simulation import InterleavedScheduler, get_log_header, set_start_method
+from utils import set_seed, create_solver
+
+
+class GridManifest(object):
+    """The experiments of a grid with their status (pending, running, done or failed), rewritten after every change,
+    so that a grid stopped at any point resumes without running again what was done."""
+
+    def __init__(self, file_name, jobs):
+        self.file_name = file_name
+        previous = {}
+        if os.path.isfile(file_name):
+            with open(file_name, "r") as file:
+                previous = {job["id"]: job for job in json.load(file)["jobs"]}
+        self.jobs = []
+        for job in jobs:
+            has_best = os.path.isfile(FileListener.get_best_file_name(job["file"], job["size"]))
+            if job["id"] not in previous:
+                # results already in output/ (e.g., from main.py) are not run again, nor overwritten
+                if has_best:
+                    job["status"] = "done"
+            else:
+                job = previous[job["id"]]
+            # running means it was interrupted, and done counts only as long as its best solution is still there
+            if job["status"] == "running" or (job["status"] == "done" and not has_best):
+                job["status"] = "pending"
+            self.jobs.append(job)
+        self.save()
+
+    def save(self):
+        manifest_dir = os.path.dirname(self.file_name)
+        if manifest_dir and not os.path.isdir(manifest_dir):
+            os.makedirs(manifest_dir)
+        with open(self.file_name + ".tmp", "w") as file:
+            json.dump({"jobs": self.jobs}, file, indent=1)
+        os.replace(self.file_name + ".tmp", self.file_name)
+
+    def update(self, job, **kwargs):
+        job.update(**kwargs)
+        self.save()
+
+    def get_jobs(self, *statuses):
+        return [job for job in self.jobs if job["status"] in statuses]
+
+    def get_counts(self):
+        counts = dict.fromkeys(["pending", "running", "done", "failed"], 0)
+        for job in self.jobs:
+            counts[job["status"]] += 1
+        return counts
+
+
+def create_jobs(config, grid):
+    """One job per seed, task and size of the grid; a size stands for its n_masses, r and mass. Jobs also keep the
+    config overrides of the grid, so that their bests can be evaluated again in the same conditions."""
+    config = dict(config, **grid.get("config", {}))
+    jobs = {}
+    for seed, task, (size, body) in itertools.product(grid["seeds"], grid["tasks"], sorted(grid["sizes"].items())):
+        file_name = FileListener.get_run_file_name(dict(config, seed=seed, task=task))
+        job = {"id": "/".join([size, file_name]), "seed": seed, "task": task, "size": size,
+               "n_masses": body["n_masses"], "r": body["r"], "mass": body["mass"], "file": file_name,
+               "config": grid.get("config", {}), "status": "pending"}
+        if job["id"] in jobs:
+            raise ValueError("Invalid grid: {} and {} have the same output files".format(jobs[job["id"]]["task"],
+                                                                                        task))
+        jobs[job["id"]] = job
+    return config, list(jobs.values())
+
+
+def create_run(config, job):
+    """Seeds and creates the solver and listener of a job, as main.py would; returns them with the config of the job
+    and its number of generations."""
+    config = dict(config, **{key: job[key] for key in ["seed", "task", "size", "n_masses", "r", "mass"]})
+    config["n_masses"] = int(config["n_masses"])
+    config["r"] = float(config["r"])
+    config["mass"] = float(config["mass"])
+    set_seed(config["seed"])
+    config["n_params"] = BaseController.get_number_of_params_for_controller(config)
+    solver = create_solver(config)
+    iterations = config["evaluations"] // solver.popsize
+    if iterations < 1:
+        raise ValueError("Invalid evaluations: {} for a population of {}".format(config["evaluations"],
+                                                                              solver.popsize))
+    listener = FileListener.create_listener(config, job["file"], get_log_header(solver))
+    return solver, iterations, config, listener
+
+
+def close_listener(listener):
+    """Closes the listener of a job, returning the error of its writes, if any, instead of raising it."""
+    try:
+        listener.close()
+    except Exception as e:
+        return e
+    return None
+
+
+def run_grid(config, manifest, interleave=1):
+    """Runs the pending (and failed) jobs of the manifest, interleave of them at a time, all on the same pool of
+    config["np"] workers, so that no worker is started (and no module imported) more than once, and the workers
+    simulate the other jobs while one waits for its slowest episodes or tells its solver."""
+    set_start_method(config)
+    jobs = manifest.get_jobs("pending", "failed")
+    running = {}
+    with Pool(config["np"]) as pool:
+        scheduler = InterleavedScheduler(pool)
+        while jobs or running:
+            while jobs and len(running) < interleave:
+                job = jobs.pop(0)
+                manifest.update(job, status="running", error=None)
+                listener = None
+                try:
+                    solver, iterations, job_config, listener = create_run(config, job)
+                    running[job["id"]] = job, listener, time.time()
+                    scheduler.add(job["id"], solver, iterations, job_config, listener)
+                except Exception as e:
+                    running.pop(job["id"], None)
+                    if listener is not None:
+                        close_listener(listener)
+                    logging.exception("job {} failed".format(job["id"]))
+                    manifest.update(job, status="failed", error=repr(e))
+            if not running:
+                continue
+            key, result, error = scheduler.wait()
+            job, listener, start_time = running.pop(key)
+            # a job whose log or best could not be written failed as well
+            error = close_listener(listener) or error
+            if error is not None:
+                # the other jobs can still run, this one is tried again on resume
+                logging.error("job {} failed".format(key), exc_info=error)
+                manifest.update(job, status="failed", error=repr(error), elapsed=time.time() - start_time)
+                continue
+            manifest.update(job, status="done", fitness=float(result[1]), elapsed=time.time() - start_time)
+            logging.warning("job {} done, fitness {} ({} done out of {})".format(
+                key, result[1], manifest.get_counts()["done"], len(manifest.jobs)))
+
+
+def get_manifest_file_name(grid_file):
+    return ".".join([os.path.join(os.getcwd(), "output", "grids", os.path.splitext(os.path.basename(grid_file))[0]),
+                     "json"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="runs every combination of seeds, tasks and sizes of a grid on one "
+                                                 "pool of workers, keeping track of what is done to resume")
+    parser.add_argument("grid", help="yaml with seeds, tasks, sizes (name: {n_masses, r, mass}) and, optionally, "
+                                     "config to override config.yaml")
+    parser.add_argument("--manifest", default=None, help="defaults to output/grids/<grid>.json")
+    parser.add_argument("--interleave", type=int, default=1, help="how many jobs to run at the same time")
+    parser.add_argument("--status", action="store_true", help="only print how many jobs are in each status")
+    args = parser.parse_args()
+    sys.argv = sys.argv[:1]
+    with open("config.yaml", "r") as yaml_file:
+        base_config = yaml.load(yaml_file, Loader=yaml.FullLoader)
+    with open(args.grid, "r") as yaml_file:
+        grid_spec = yaml.load(yaml_file, Loader=yaml.FullLoader)
+    grid_config, grid_jobs = create_jobs(base_config, grid_spec)
+    grid_manifest = GridManifest(args.manifest or get_manifest_file_name(args.grid), grid_jobs)
+    if not args.status:
+        run_grid(grid_config, grid_manifest, args.interleave)
+    print(";".join(["{}={}".format(status, count) for status, count in grid_manifest.get_counts().items()]))
+    sys.exit(1 if grid_manifest.get_jobs("failed") else 0)
@@ -0,0 +1,51 @@
+import time
+
+import gym
+import numpy as np
+
+from simulators import BaseSimulator, HeadlessFramework
+
+
+class NoRenderRLSimulator(BaseSimulator, HeadlessFramework, gym.Env):
+
+    def __init__(self, config, solution, listener, save_video=False):
+        HeadlessFramework.__init__(self)
+        BaseSimulator.__init__(self, config, solution, save_video)
+        self.renderer = None
+        self.world.renderer = self.renderer
+        self.groundbody = self.world.CreateBody()
+        self.action_space = gym.spaces.Box(low=np.array([-1.0 for _ in range(self.morphology.get_output_dim())],
+                                                        dtype=np.float32),
+                                           high=np.array([1.0 for _ in range(self.morphology.get_output_dim())],
+                                                         dtype=np.float32))
+        self.observation_space = gym.spaces.Box(low=np.array([0.0 for _ in range(self.morphology.get_input_dim())],
+                                                             dtype=np.float32),
+                                                high=np.array([1.0 for _ in range(self.morphology.get_input_dim())],
+                                                              dtype=np.float32))
+        self.listener = listener
+        self.start = time.time()
+
+    def get_world(self):
+        return self.world
+
+    def get_step_count(self):
+        return self.stepCount
+
+    def inner_step(self, action):
+        self.SimulationLoop()
+        self.morphology.apply_control(action)
+        obs = self.morphology.get_obs()
+        reward = self.env.get_reward(self.morphology, self.get_step_count())
+        return obs, reward, False, {}
+
+    def render(self, mode="human"):
+        pass
+
+    def SimulationLoop(self):
+        self.Step(self.settings)
+
+    def Step(self, settings):
+        self.physics_step(settings)
+
+
+gym.envs.registration.register(id="RL-v0", entry_point="gym_simulators:NoRenderRLSimulator", max_episode_steps=600)
@@ -1,14 +1,22 @@
+import atexit
 import os
+import threading
 
 import numpy as np
 
 
 class FileListener(object):
+    """Buffers rows (and the latest best) in memory and writes them from a background thread every flush_interval
+    seconds and on close, so that logging never blocks evolution. With columns, every column is also appended as raw
+    float64 to a file of its own, next to the `;`-separated log. If a write fails, the thread stops and the error is
+    raised by the next listen, save_best or close."""
 
-    def __init__(self, file_name, size, header):
+    def __init__(self, file_name, size, header, flush_interval=1.0, columns=False):
         self.file_name = file_name
         self.size = size
         self.header = header
+        self.flush_interval = flush_interval
+        self.columns = columns
         log_dir = "/".join(self.get_log_file_name(file_name, size).split("/")[:-1])
         if not os.path.isdir(log_dir):
             os.makedirs(log_dir)
@@ -17,18 +25,127 @@ class FileListener(object):
             os.makedirs(bests_dir)
         with open(self.get_log_file_name(file_name, size), "w") as file:
             file.write(";".join(header) + "\n")
+        if self.columns:
+            columns_dir = self.get_columns_dir_name(file_name, size)
+            if not os.path.isdir(columns_dir):
+                os.makedirs(columns_dir)
+            with open(os.path.join(columns_dir, "header"), "w") as file:
+                file.write(";".join(header) + "\n")
+            for col in header:
+                open(os.path.join(columns_dir, ".".join([col, "float64"])), "wb").close()
+        self._rows = []
+        self._best = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._error = None
+        self._writer = threading.Thread(target=self._write_periodically, daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def create_listener(cls, config, file_name, header):
+        return cls(file_name, config["size"], header, config["log_flush_interval"], bool(config["log_columns"]))
 
     def listen(self, **kwargs):
-        with open(self.get_log_file_name(self.file_name, self.size), "a") as file:
-            file.write(";".join([str(kwargs.get(col, None)) for col in self.header]) + "\n")
+        self._raise_error()
+        row = [kwargs.get(col, None) for col in self.header]
+        with self._lock:
+            self._rows.append(row)
 
     def save_best(self, solution):
-        np.save(self.get_best_file_name(self.file_name, self.size), solution)
+        self._raise_error()
+        # only the latest best is ever written
+        with self._lock:
+            self._best = np.array(solution)
+
+    def _write_periodically(self):
+        try:
+            while not self._closed.wait(self.flush_interval):
+                self.flush()
+            self.flush()
+        except Exception as e:
+            # nothing is written after this, so the run is told as soon as it listens again
+            self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise RuntimeError("Invalid log: writing {} failed".format(self.file_name)) from self._error
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                best, self._best = self._best, None
+            if rows:
+                with open(self.get_log_file_name(self.file_name, self.size), "a") as file:
+                    file.write("".join([";".join([str(value) for value in row]) + "\n" for row in rows]))
+                if self.columns:
+                    self._write_columns(rows)
+            if best is not None:
+                # written aside and renamed, so that the best file is never seen half-written
+                file_name = self.get_best_file_name(self.file_name, self.size)
+                with open(file_name + ".tmp", "wb") as file:
+                    np.save(file, best)
+                os.replace(file_name + ".tmp", file_name)
+
+    def _write_columns(self, rows):
+        columns_dir = self.get_columns_dir_name(self.file_name, self.size)
+        for i, col in enumerate(self.header):
+            values = np.array([self._to_float(row[i]) for row in rows], dtype="<f8")
+            with open(os.path.join(columns_dir, ".".join([col, "float64"])), "ab") as file:
+                file.write(values.tobytes())
+
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    def close(self):
+        if not self._closed.is_set():
+            self._closed.set()
+            self._writer.join()
+            atexit.unregister(self.close)
+        self._raise_error()
+
+    @classmethod
+    def read_columns(cls, file_name, size):
+        """Returns the columns written so far, as a dict of arrays of the same length."""
+        columns_dir = cls.get_columns_dir_name(file_name, size)
+        with open(os.path.join(columns_dir, "header"), "r") as file:
+            header = file.readline().strip().split(";")
+        columns = {col: np.fromfile(os.path.join(columns_dir, ".".join([col, "float64"])), dtype="<f8")
+                   for col in header}
+        # a flush interrupted midway may have appended to some columns only
+        length = min([len(values) for values in columns.values()])
+        return {col: values[:length] for col, values in columns.items()}
+
+    @classmethod
+    def get_run_file_name(cls, config):
+        return ".".join([config["solver"], str(config["seed"]), config["task"].split("-")[0], config["brain"]])
 
     @classmethod
     def get_log_file_name(cls, file_name, size):
         return ".".join([os.path.join(os.getcwd(), "output", size, "logs", file_name), "txt"])
 
+    @classmethod
+    def get_columns_dir_name(cls, file_name, size):
+        return ".".join([os.path.join(os.getcwd(), "output", size, "logs", file_name), "columns"])
+
     @classmethod
     def get_best_file_name(cls, file_name, size):
         return ".".join([os.path.join(os.getcwd(), "output", size, "bests", file_name), "npy"])
+
+    @classmethod
+    def get_inflate_file_name(cls, file_name, size):
+        return ".".join([os.path.join(os.getcwd(), "output", size, "inflate", file_name), "npy"])
+
+    @classmethod
+    def get_video_file_name(cls, file_name, size):
+        return ".".join([os.path.join(os.getcwd(), "output", size, "videos", file_name), "mp4"])
+
+    @classmethod
+    def get_replay_file_name(cls, file_name, size, iteration):
+        return ".".join([os.path.join(os.getcwd(), "output", size, "replays", file_name), str(iteration), "npz"])
@@ -1,4 +1,6 @@
+import glob
 import logging
+import os
 import sys
 
 import numpy as np
@@ -6,7 +8,9 @@ import yaml
 
 from controllers import BaseController
 from listener import FileListener
-from simulation import simulation, parallel_solve, inflate_simulation
+from replay import render_replays
+from simulation import simulation, parallel_solve, inflate_simulation, island_solve, get_log_header, \
+    set_start_method, inflate_sweep
 from utils import set_seed, create_solver, random_solution
 
 
@@ -24,23 +28,38 @@ if __name__ == "__main__":
     config["n_masses"] = int(sys.argv[4])
     config["r"] = float(sys.argv[5])
     config["mass"] = float(sys.argv[6])
+    set_start_method(config)
     set_seed(config["seed"])
     config["n_params"] = BaseController.get_number_of_params_for_controller(config)
-    file_name = ".".join([config["solver"], str(config["seed"]), config["task"].split("-")[0], config["brain"]])
+    file_name = FileListener.get_run_file_name(config)
     if config["mode"] == "random":
         print("fitness: {}".format(simulation(config, random_solution(config), render=not config["save_video"])))
+    elif config["mode"] == "opt-islands":
+        listener = FileListener.create_listener(config, file_name, ["island", "best.fitness"])
+        best = island_solve(config, listener)
+        listener.close()
+        logging.warning("fitness score at this local optimum: {}".format(best[1]))
     elif config["mode"].startswith("opt"):
-        listener = FileListener(file_name, config["size"], ["iteration", "elapsed.sec", "evaluations", "best.fitness"])
         solver = create_solver(config)
+        listener = FileListener.create_listener(config, file_name, get_log_header(solver))
         if not config["mode"].endswith("parallel"):
             config["np"] = 1
         best = parallel_solve(solver, config["evaluations"] // solver.popsize, config, listener)
+        listener.close()
         logging.warning("fitness score at this local optimum: {}".format(best[1]))
     elif config["mode"] == "best":
         best = np.load(FileListener.get_best_file_name(file_name, config["size"]))
         print("fitness: {}".format(simulation(config, best, render=not config["save_video"])))
     elif config["mode"] == "inflate":
-        listener = FileListener(file_name, config["size"], ["t", "p", "a", "r"])
+        listener = FileListener.create_listener(config, file_name, ["t", "p", "a", "r"])
         inflate_simulation(config, listener, render=not config["save_video"])
+        listener.close()
+    elif config["mode"] == "inflate-sweep":
+        sweep_file = FileListener.get_inflate_file_name(file_name, config["size"])
+        if not os.path.isdir(os.path.dirname(sweep_file)):
+            os.makedirs(os.path.dirname(sweep_file))
+        np.save(sweep_file, inflate_sweep(config))
+    elif config["mode"] == "replay":
+        render_replays(sorted(glob.glob(FileListener.get_replay_file_name(file_name, config["size"], "*"))), config)
     else:
         raise ValueError("Invalid mode: {}".format(config["mode"]))
@@ -32,16 +32,21 @@ class PressureSoftBody(BaseSoftBody):
         self.masses = []
         self.joints = []
         self._add_masses(fixture)
-        self.sensor = Sensor(self.n_masses * 3 + 2 + 1, 0.25 * 60, self)
+        self.sensor = Sensor(self.n_masses * 3 + 2 + 1, 0.25 * 60, self, np.dtype(config["dtype"]))
         self.control_pressure = config["control_pressure"]
         self.control_joints = config["control_joints"]
         max_p = self.get_maximum_pressure(self.T, self.mass, self.r)
         min_p = max_p * 0.2
         self.pressure = PressureData(self._compute_pressure(), min_p, (max_p - min_p) / 2 + min_p, max_p)
 
+    @staticmethod
+    def get_pressure_at_rest(T, mass, r):
+        # the pressure of the gas in the circle of radius r
+        return (PressureSoftBody.R * T * mass * PressureSoftBody.mol) / (r ** 2 * math.pi)
+
     @staticmethod
     def get_maximum_pressure(T, mass, r):
-        return ((PressureSoftBody.R * T * mass * PressureSoftBody.mol) / (r ** 2 * math.pi)) * 1.25
+        return PressureSoftBody.get_pressure_at_rest(T, mass, r) * 1.25
 
     def _add_masses(self, fixture):
         delta_theta = (360 * math.pi / 180) / self.n_masses
@@ -0,0 +1,77 @@
+import cProfile
+import io
+import os
+import pstats
+
+
+class ProfileStats(object):
+    """The stats of a cProfile.Profile, as sent back by a worker, in a form that pstats can load."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Profiler(object):
+    """Sums the timers of every rollout per worker and merges the cProfile stats of the workers (if they profiled),
+    to report them at the end of evolution."""
+
+    def __init__(self):
+        self.workers = {}
+        self.stats = None
+
+    @staticmethod
+    def profile(function, *args, **kwargs):
+        """Calls function under cProfile, returns its result and the stats (which can be pickled)."""
+        profiler = cProfile.Profile()
+        result = profiler.runcall(function, *args, **kwargs)
+        profiler.create_stats()
+        return result, profiler.stats
+
+    def add(self, telemetry):
+        telemetry = dict(telemetry)
+        stats = telemetry.pop("profile", None)
+        worker = self.workers.setdefault(telemetry.pop("pid"), {"rollouts": 0})
+        worker["rollouts"] += 1
+        for col, value in telemetry.items():
+            # memory is a peak, not a time
+            worker[col] = max(worker.get(col, 0), value) if col == "peak.rss.mb" else worker.get(col, 0) + value
+        if stats is not None:
+            if self.stats is None:
+                self.stats = pstats.Stats(ProfileStats(stats))
+            else:
+                self.stats.add(ProfileStats(stats))
+
+    def get_report(self, num_functions=40):
+        cols = sorted(set(col for worker in self.workers.values() for col in worker))
+        lines = [";".join(["worker"] + cols)]
+        total = {}
+        for pid, worker in sorted(self.workers.items()):
+            lines.append(";".join([str(pid)] + [str(worker.get(col, 0)) for col in cols]))
+            for col in cols:
+                total[col] = max(total.get(col, 0), worker.get(col, 0)) if col == "peak.rss.mb" \
+                    else total.get(col, 0) + worker.get(col, 0)
+        lines.append(";".join(["total"] + [str(total[col]) for col in cols]))
+        report = "\n".join(lines) + "\n"
+        if self.stats is not None:
+            stream = io.StringIO()
+            self.stats.stream = stream
+            self.stats.sort_stats("cumulative").print_stats(num_functions)
+            report += "\n" + stream.getvalue()
+        return report
+
+    def save(self, file_name, size):
+        profile_dir = os.path.dirname(self.get_profile_file_name(file_name, size, "txt"))
+        if not os.path.isdir(profile_dir):
+            os.makedirs(profile_dir)
+        with open(self.get_profile_file_name(file_name, size, "txt"), "w") as file:
+            file.write(self.get_report())
+        if self.stats is not None:
+            # the format of cProfile, for pstats, snakeviz or flameprof
+            self.stats.dump_stats(self.get_profile_file_name(file_name, size, "prof"))
+
+    @classmethod
+    def get_profile_file_name(cls, file_name, size, extension):
+        return ".".join([os.path.join(os.getcwd(), "output", size, "profiles", file_name), extension])
@@ -0,0 +1,41 @@
+import pygame
+from Box2D.examples.framework import Framework
+from Box2D.examples.framework import FrameworkBase
+
+from simulators import BaseSimulator
+
+
+class RenderSimulator(Framework, BaseSimulator):
+
+    def __init__(self, config, solution, save_video=False):
+        Framework.__init__(self)
+        BaseSimulator.__init__(self, config, solution, save_video)
+        self.gui_table.updateGUI(self.settings)
+        self.clock = pygame.time.Clock()
+
+    def get_world(self):
+        return self.world
+
+    def get_step_count(self):
+        return self.stepCount
+
+    def inner_step(self):
+        self.checkEvents()
+        self.screen.fill((0, 0, 0))
+        self.CheckKeys()
+        self.SimulationLoop()
+        if self.settings.drawMenu:
+            self.gui_app.paint(self.screen)
+        pygame.display.flip()
+        self.clock.tick(self.settings.hz)
+        self.fps = self.clock.get_fps()
+
+    def step_world(self, settings):
+        FrameworkBase.Step(self, settings)
+
+    def Step(self, settings):
+        settings.drawMenu = False
+        settings.drawStats = False
+        settings.drawFPS = False
+        self.physics_step(settings)
+        self.act(self.stepCount)
@@ -1,27 +1,83 @@
 import abc
+import collections
+import os
+import queue
+import subprocess
+import threading
 
+import numpy as np
 import pygame.time
+from Box2D import b2_staticBody
 from Box2D.examples.settings import fwSettings
 
 
+class VideoWriter(object):
+    """Streams raw RGB frames into the stdin of an ffmpeg process, no frames are written to disk."""
+
+    def __init__(self, file_name, size, fps=60, codec="mpeg4", max_pending_frames=32):
+        self.file_name = file_name
+        self.size = size
+        video_dir = os.path.dirname(file_name)
+        if video_dir and not os.path.isdir(video_dir):
+            os.makedirs(video_dir)
+        self.process = subprocess.Popen(["ffmpeg", "-loglevel", "error", "-y",
+                                         "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", "{}x{}".format(*size),
+                                         "-r", str(fps), "-i", "-",
+                                         "-vcodec", codec, "-vf", "format=yuv420p", file_name],
+                                        stdin=subprocess.PIPE, bufsize=0)
+        # bounded, so that a slow encoder throttles the simulation instead of buffering the whole episode
+        self._frames = queue.Queue(maxsize=max_pending_frames)
+        self._writer = threading.Thread(target=self._write_frames, daemon=True)
+        self._writer.start()
+
+    def _write_frames(self):
+        while True:
+            frame = self._frames.get()
+            if frame is None:
+                break
+            try:
+                self.process.stdin.write(frame)
+            except BrokenPipeError:
+                pass  # ffmpeg exited early, keep draining and let close() report it
+
+    def write(self, surface):
+        self._frames.put(pygame.image.tostring(surface, "RGB"))
+
+    def close(self):
+        self._frames.put(None)
+        self._writer.join()
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError("ffmpeg failed to encode {}".format(self.file_name))
+
+
 class BaseRenderer(abc.ABC):
 
     @abc.abstractmethod
-    def draw_image(self, env, file_name=None):
+    def draw_image(self, env):
         pass
 
     @abc.abstractmethod
     def render(self):
         pass
 
+    def should_draw(self, t):
+        return True
+
+    def close(self):
+        pass
+
     @classmethod
-    def create_renderer(cls, render, save_video):
-        return PygameRenderer(750, save_video) if render or save_video else NoneRenderer()
+    def create_renderer(cls, config, render, video_name=None):
+        if video_name is not None:
+            return PygameRenderer(config["video_size"], video_name, config["video_fps"], config["video_codec"],
+                                  config["video_interval"])
+        return PygameRenderer(750) if render else NoneRenderer()
 
 
 class NoneRenderer(BaseRenderer):
 
-    def draw_image(self, env, file_name=None):
+    def draw_image(self, env):
         return
 
     def render(self):
@@ -29,47 +85,136 @@ class NoneRenderer(BaseRenderer):
 
 
 class PygameRenderer(BaseRenderer):
+    terrain_color = (0, 0, 255)
+    body_color = (255, 0, 0)
+    outline_color = (219, 112, 147)
+    joint_color = (255, 255, 255)
 
-    def __init__(self, size, save_video):
+    def __init__(self, size, video_name=None, fps=60, codec="mpeg4", interval=1, max_tiles=16):
         self.clock = pygame.time.Clock()
         pygame.init()
-        if save_video:
+        self.interval = interval
+        if video_name is not None:
             self.screen = pygame.Surface((size, size))
+            self.video = VideoWriter(video_name, (size, size), fps, codec)
         else:
             self.screen = pygame.display.set_mode((size, size))
+            self.video = None
         self.screen.fill((0, 0, 0))
         self.magnify = size / 50
+        self.max_tiles = max_tiles
+        self._scene = None
+        self._edges = None
+        self._tiles = collections.OrderedDict()
+        self._half_sizes = None
+        self._sprites = None
 
-    def draw_image(self, env, file_name=None):
-        self.screen.fill((0, 0, 0))
+    def should_draw(self, t):
+        # only video is decimated, the interactive display shows every step
+        return self.video is None or t % self.interval == 0
+
+    def draw_image(self, env):
+        if self._scene is None or self._scene[0] is not env.env:
+            self._scene = self._read_scene(env.env, env.morphology)
+        _, edges, objects, object_radii, half_sizes = self._scene
+        positions = np.array([(mass.position.x, mass.position.y) for mass in env.morphology.masses])
+        anchors = np.array([(joint.anchorA.x, joint.anchorA.y, joint.anchorB.x, joint.anchorB.y)
+                            for joint in env.morphology.joints]).reshape(-1, 2, 2)
+        object_positions = np.array([(body.position.x, body.position.y) for body in objects]).reshape(-1, 2)
+        self.draw_frame(np.mean(positions, axis=0), edges, object_positions, object_radii, positions, half_sizes,
+                        anchors)
+
+    @staticmethod
+    def _read_scene(env, morphology):
+        edges = np.array([body.fixtures[0].shape.vertices for body in env.bodies if body.type == b2_staticBody],
+                         dtype=np.float64).reshape(-1, 2, 2)
+        objects = [body for body in env.bodies if body.type != b2_staticBody]
+        object_radii = np.array([body.fixtures[0].shape.radius for body in objects])
+        half_sizes = np.array([np.ptp(mass.fixtures[0].shape.vertices, axis=0) / 2 for mass in morphology.masses])
+        return env, edges, objects, object_radii, half_sizes
+
+    def draw_frame(self, center, edges, object_positions, object_radii, positions, half_sizes, anchors):
+        w, h = self.screen.get_size()
+        # screen coordinates are canvas coordinates (world scaled and flipped vertically) minus this offset
+        offset = np.array([center[0] * self.magnify - w / 2, - center[1] * self.magnify - h / 2])
+        scale = np.array([self.magnify, - self.magnify])
+        self._draw_terrain(edges, offset)
+        for (cx, cy), radius in zip(np.asarray(object_positions) * scale - offset, object_radii):
+            pygame.draw.circle(self.screen, self.body_color, (float(cx), float(cy)), float(radius * self.magnify), 0)
+            pygame.draw.circle(self.screen, self.outline_color, (float(cx), float(cy)),
+                               float(radius * self.magnify), 2)
+        if half_sizes is not self._half_sizes:
+            self._half_sizes = half_sizes
+            self._sprites = self._create_sprites(half_sizes)
+        top_left = (np.asarray(positions) + np.asarray(half_sizes) * [-1, 1]) * scale - offset
+        self.screen.blits(list(zip(self._sprites, top_left.round().astype(int).tolist())), doreturn=False)
+        for points in self._chain(np.asarray(anchors) * scale - offset):
+            pygame.draw.lines(self.screen, self.joint_color, False, points.tolist(), 3)
+
+    def _create_sprites(self, half_sizes):
+        sizes, inverse = np.unique(np.round(np.asarray(half_sizes) * 2 * self.magnify).astype(int), axis=0,
+                                   return_inverse=True)
+        sprites = []
+        for width, height in sizes:
+            sprite = pygame.Surface((width, height))
+            sprite.fill(self.body_color)
+            pygame.draw.rect(sprite, self.outline_color, (0, 0, width, height), 2)
+            sprites.append(sprite)
+        return [sprites[i] for i in inverse.ravel()]
+
+    @staticmethod
+    def _chain(segments):
+        """Joins consecutive segments sharing an endpoint into one polyline, to draw them with a single call."""
+        if len(segments) == 0:
+            return []
+        starts, ends = segments[:, 0], segments[:, 1]
+        if np.allclose(starts[1:], ends[:-1]):
+            return [np.concatenate([starts[:1], ends])]
+        elif np.allclose(ends[1:], starts[:-1]):
+            return [np.concatenate([ends[:1], starts])]
+        return list(segments)
+
+    def _draw_terrain(self, edges, offset):
+        if edges is not self._edges:
+            self._edges = edges
+            self._tiles.clear()
         w, h = self.screen.get_size()
-        center_x, center_y = env.morphology.get_center_of_mass()
-        env.env.draw_env(w, h, (center_x, center_y), self.screen, self.magnify)
-        for mass in env.morphology.masses:
-            shape = mass.fixtures[0].shape
-            half_width = abs(shape.vertices[0][0] - shape.vertices[1][0]) / 2
-            half_height = abs(shape.vertices[0][1] - shape.vertices[2][1]) / 2
-            cx, cy = mass.position.x, mass.position.y
-            vertices = [(cx - half_width, cy - half_height), (cx + half_width, cy - half_height),
-                        (cx + half_width, cy + half_height), (cx - half_width, cy + half_height)]
-            new_vertices = [
-                ((x - center_x) * self.magnify + w / 2, h - ((y - center_y) * self.magnify + h / 2)) for
-                x, y in vertices]
-            pygame.draw.rect(self.screen, (255, 0, 0),
-                             (new_vertices[3][0], new_vertices[3][1],
-                              half_width * 2 * self.magnify, half_height * 2 * self.magnify), 0)
-            pygame.draw.rect(self.screen, (219, 112, 147),
-                             (new_vertices[3][0], new_vertices[3][1],
-                              half_width * 2 * self.magnify, half_height * 2 * self.magnify), 2)
-        for joint in env.morphology.joints:
-            l_x, l_y, r_x, r_y = (joint.anchorA.x - center_x) * self.magnify + w / 2, \
-                                 (joint.anchorA.y - center_y) * self.magnify + h / 2, \
-                                 (joint.anchorB.x - center_x) * self.magnify + w / 2, \
-                                 (joint.anchorB.y - center_y) * self.magnify + h / 2
-            pygame.draw.lines(self.screen, (255, 255, 255), False, [(l_x, h - l_y), (r_x, h - r_y)], 3)
-        if file_name is not None:
-            pygame.image.save(self.screen, file_name)
+        first_i, first_j = np.floor(offset / [w, h]).astype(int)
+        last_i, last_j = np.floor((offset + [w - 1, h - 1]) / [w, h]).astype(int)
+        blits = []
+        for i in range(first_i, last_i + 1):
+            for j in range(first_j, last_j + 1):
+                blits.append((self._get_tile(i, j), (int(round(i * w - offset[0])), int(round(j * h - offset[1])))))
+        self.screen.blits(blits, doreturn=False)
+
+    def _get_tile(self, i, j):
+        """Static terrain is pre-drawn on screen-sized tiles of the canvas, kept in a bounded LRU cache."""
+        if (i, j) in self._tiles:
+            self._tiles.move_to_end((i, j))
+            return self._tiles[(i, j)]
+        w, h = self.screen.get_size()
+        tile = pygame.Surface((w, h))
+        tile.fill((0, 0, 0))
+        if len(self._edges):
+            points = self._edges * [self.magnify, - self.magnify] - [i * w, j * h]
+            lower, upper = points.min(axis=1), points.max(axis=1)
+            visible = np.all((upper >= - 5) & (lower <= [w + 5, h + 5]), axis=1)
+            for (x0, y0), (x1, y1) in points[visible].tolist():
+                pygame.draw.line(tile, self.terrain_color, (x0, y0), (x1, y1), 5)
+        self._tiles[(i, j)] = tile
+        if len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+        return tile
 
     def render(self):
+        if self.video is not None:
+            self.video.write(self.screen)
+            return
         pygame.display.flip()
         self.clock.tick(fwSettings.hz)
+
+    def close(self):
+        if self.video is not None:
+            self.video.close()
+            # restores the default SIGTERM handler, or pool workers that rendered could not be terminated
+            pygame.quit()
@@ -0,0 +1,80 @@
+import os
+from multiprocessing import Pool
+
+import numpy as np
+from Box2D import b2_staticBody
+
+
+class ReplayRecorder(object):
+    """Records the geometry of an episode, so that it can be rendered later without re-running the physics."""
+
+    def __init__(self, env, morphology):
+        self.edges = np.array([body.fixtures[0].shape.vertices for body in env.bodies if body.type == b2_staticBody],
+                              dtype=np.float32).reshape(-1, 2, 2)
+        self.objects = [body for body in env.bodies if body.type != b2_staticBody]
+        self.object_radii = np.array([body.fixtures[0].shape.radius for body in self.objects], dtype=np.float32)
+        self.half_sizes = np.array([np.ptp(mass.fixtures[0].shape.vertices, axis=0) / 2 for mass in morphology.masses],
+                                   dtype=np.float32)
+        self.positions = []
+        self.anchors = []
+        self.object_positions = []
+
+    def record(self, morphology):
+        self.positions.append([(mass.position.x, mass.position.y) for mass in morphology.masses])
+        self.anchors.append([(joint.anchorA.x, joint.anchorA.y, joint.anchorB.x, joint.anchorB.y)
+                             for joint in morphology.joints])
+        self.object_positions.append([(body.position.x, body.position.y) for body in self.objects])
+
+    def save(self, file_name):
+        if not os.path.isdir(os.path.dirname(file_name)):
+            os.makedirs(os.path.dirname(file_name))
+        n_steps = len(self.positions)
+        np.savez_compressed(file_name,
+                            edges=self.edges,
+                            half_sizes=self.half_sizes,
+                            object_radii=self.object_radii,
+                            positions=np.array(self.positions, dtype=np.float32).reshape(n_steps, -1, 2),
+                            anchors=np.array(self.anchors, dtype=np.float32).reshape(n_steps, -1, 2, 2),
+                            object_positions=np.array(self.object_positions, dtype=np.float32).reshape(n_steps, -1, 2))
+
+
+class Replay(object):
+
+    def __init__(self, file_name):
+        with np.load(file_name) as data:
+            self.edges = data["edges"]
+            self.half_sizes = data["half_sizes"]
+            self.object_radii = data["object_radii"]
+            self.positions = data["positions"]
+            self.anchors = data["anchors"]
+            self.object_positions = data["object_positions"]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get_center_of_mass(self, t):
+        return np.mean(self.positions[t], axis=0)
+
+    @classmethod
+    def get_video_name(cls, file_name):
+        return ".".join([os.path.splitext(file_name)[0], "mp4"])
+
+
+def render_replay(args):
+    # only rendering needs pygame, recording does not
+    from renderer import BaseRenderer
+    file_name, config = args
+    replay = Replay(file_name)
+    renderer = BaseRenderer.create_renderer(config, False, Replay.get_video_name(file_name))
+    for t in range(len(replay)):
+        if not renderer.should_draw(t):
+            continue
+        renderer.draw_frame(replay.get_center_of_mass(t), replay.edges, replay.object_positions[t],
+                            replay.object_radii, replay.positions[t], replay.half_sizes, replay.anchors[t])
+        renderer.render()
+    renderer.close()
+
+
+def render_replays(file_names, config):
+    with Pool(config["np"]) as pool:
+        pool.map(render_replay, [(file_name, config) for file_name in file_names])
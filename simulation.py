@@ -1,52 +1,402 @@
+import collections
+import importlib
+import itertools
 import logging
 import math
+import multiprocessing
+import os
+import queue
+import resource
+import threading
 import time
-from multiprocessing import Pool
+from multiprocessing import Pool, Process, Queue
+from multiprocessing.sharedctypes import RawArray
 
 import numpy as np
 
-from simulators import RenderSimulator, NoRenderSimulator
+from archive import PopulationArchive
+from listener import FileListener
+from profiler import Profiler
+from replay import ReplayRecorder, render_replay
+from simulators import NoRenderSimulator
+from utils import create_solver, set_seed, get_random_state, set_random_state
 
 
-def parallel_solve(solver, iterations, config, listener):
+def set_start_method(config):
+    """Starts the workers with config["start_method"]. Forked workers inherit what the parent imported, so the
+    modules they need are imported here once; a forkserver imports them once and forks every worker from a clean,
+    single-threaded process (no listener thread) instead."""
+    modules = ["simulation"] + (["torch"] if config["brain"] == "mlp" else [])
+    multiprocessing.set_start_method(config["start_method"])
+    if config["start_method"] == "forkserver":
+        multiprocessing.set_forkserver_preload(modules)
+    elif config["start_method"] == "fork":
+        for module in modules:
+            importlib.import_module(module)
+
+
+def parallel_solve(solver, iterations, config, listener, migration=None, pool=None):
+    steps = solve_steps(solver, iterations, config, listener, migration, pool)
+    while True:
+        try:
+            next(steps)
+        except StopIteration as e:
+            return e.value
+
+
+def solve_steps(solver, iterations, config, listener, migration=None, pool=None, callback=None):
+    """parallel_solve as a generator, which yields every time a generation has been submitted to the workers and
+    collects it when resumed; callback is called when the generation is evaluated (e.g., to resume it then). Returns
+    the best solution and fitness."""
+    # candidates are dispatched one at a time, so the workers need not divide the population
     num_workers = config["np"]
-    if solver.popsize % num_workers != 0:
-        raise RuntimeError("better to have n. workers divisor of pop size")
     best_result = None
     best_fitness = float("-inf")
+    # a dedicated process replays new bests, so that recording and rendering never block evolution
+    replays = ReplayQueue() if int(config.get("save_replay", 0)) else None
+    archive = PopulationArchive.create_archive(config, listener.file_name, solver.num_params) \
+        if int(config["save_archive"]) else None
+    profiler = Profiler() if int(config["profile"]) else None
+    noise_table = getattr(solver, "noise_table", None)
+    # a pool given by the caller (e.g., shared by the experiments of a grid) is left running; its workers do not
+    # have the noise table, though, so solvers with one still get a pool of their own
+    shared = pool is not None and noise_table is None
+    center = None
+    if noise_table is not None:
+        # workers rebuild each candidate from the shared noise table and the current mu and sigma, which are
+        # written to shared memory before every generation, so only (offset, sign) pairs are sent
+        center = RawArray(np.ctypeslib.as_ctypes_type(solver.dtype), 2 * solver.num_params)
+        pool = Pool(num_workers, initializer=init_noise_worker, initargs=(noise_table, center))
+        center = np.ctypeslib.as_array(center).reshape(2, solver.num_params)
+    elif pool is None:
+        pool = Pool(num_workers)
     start_time = time.time()
-    for j in range(iterations):
-        solutions = solver.ask()
-        with Pool(num_workers) as pool:
-            results = pool.map(parallel_wrapper, [(config, solutions[i], i) for i in range(solver.popsize)])
-        fitness_list = [value for _, value in sorted(results, key=lambda x: x[0])]
-        solver.tell(fitness_list)
-        result = solver.result()  # first element is the best solution, second element is the best fitness
-        if (j + 1) % 10 == 0:
-            logging.warning("fitness at iteration {}: {}".format(j + 1, result[1]))
-        listener.listen(**{"iteration": j, "elapsed.sec": time.time() - start_time,
-                           "evaluations": j * solver.popsize, "best.fitness": result[1]})
-        if result[1] >= best_fitness or best_result is None:
-            best_result = result[0]
-            best_fitness = result[1]
-            listener.save_best(best_result)
+    evaluations = 0
+    try:
+        pending, solutions = submit_generation(pool, solver, config, center, callback)
+        for j in range(iterations):
+            if hasattr(solver, "presample") and j + 1 < iterations:
+                solver.presample()  # while the workers simulate
+            yield
+            results = pending.get()
+            # the workers are idle from here until the next generation is submitted
+            solver_start = time.perf_counter()
+            fitness_list = [value for _, value, _ in sorted(results, key=lambda x: x[0])]
+            solver.tell(fitness_list)
+            result = solver.result()  # first element is the best solution, second element is the best fitness
+            # population size may change (e.g., on restarts), so also stop when the evaluation budget is spent
+            done = j + 1 == iterations or evaluations + len(results) >= config["evaluations"]
+            if migration is not None and not done:
+                migration.migrate(j, solver)
+            # some solvers (e.g., ga) sample the next generation in place
+            evaluated = np.copy(solutions) if archive is not None else None
+            if not done:
+                # keep the workers busy with the next generation while logging (and archiving) this one
+                pending, solutions = submit_generation(pool, solver, config, center, callback)
+            solver_time = time.perf_counter() - solver_start
+            if archive is not None:
+                archive.append(j, evaluated, fitness_list)
+            if profiler is not None:
+                for _, _, telemetry in results:
+                    profiler.add(telemetry)
+            if (j + 1) % 10 == 0:
+                logging.warning("fitness at iteration {}: {}".format(j + 1, result[1]))
+            listener.listen(**dict(aggregate_telemetry([telemetry for _, _, telemetry in results]),
+                                   **{"iteration": j, "elapsed.sec": time.time() - start_time,
+                                      "evaluations": evaluations, "best.fitness": result[1], "popsize": len(results),
+                                      "restarts": getattr(solver, "restarts", 0), "solver.sec": solver_time}))
+            evaluations += len(results)
+            if result[1] >= best_fitness or best_result is None:
+                best_result = result[0]
+                best_fitness = result[1]
+                listener.save_best(best_result)
+                if replays is not None:
+                    replays.submit((config, np.array(best_result), listener.get_replay_file_name(
+                        listener.file_name, listener.size, j)))
+            if done:
+                break
+    finally:
+        # also when a generation, callback or migration raised, so that no replay process nor archive is left open
+        if not shared:
+            pool.terminate()
+        if replays is not None:
+            replays.close()
+        if archive is not None:
+            archive.close()
+    if profiler is not None:
+        profiler.save(listener.file_name, listener.size)
     return best_result, best_fitness
 
 
+def island_solve(config, listener):
+    """Evolves config["islands"] independent populations in as many processes, each with its own share of the
+    workers and of the evaluations; every config["migration_interval"] generations each island sends its best to the
+    next one in a ring. Islands that fail are logged and skipped."""
+    num_islands = config["islands"]
+    if config["np"] % num_islands != 0:
+        raise RuntimeError("better to have n. islands divisor of n. workers")
+    channels = [Queue() for _ in range(num_islands)]
+    results = Queue()
+    islands = [Process(target=island_wrapper, args=((config, listener.file_name, i, channels[i],
+                                                      channels[(i + 1) % num_islands], results),))
+               for i in range(num_islands)]
+    for island in islands:
+        island.start()
+    best_result = None
+    best_fitness = float("-inf")
+    remaining = set(range(num_islands))
+    while remaining:
+        try:
+            i, result, fitness, error = results.get(timeout=1.0)
+        except queue.Empty:
+            # an island that was killed (e.g., out of memory) never reports
+            for i in sorted(remaining):
+                if islands[i].exitcode not in [None, 0]:
+                    remaining.discard(i)
+                    logging.error("island {} exited with code {}".format(i, islands[i].exitcode))
+            continue
+        remaining.discard(i)
+        if error is not None:
+            logging.error("island {} failed: {}".format(i, error))
+            continue
+        listener.listen(**{"island": i, "best.fitness": fitness})
+        if fitness >= best_fitness or best_result is None:
+            best_result = result
+            best_fitness = fitness
+    for island in islands:
+        island.join()
+    if best_result is None:
+        raise RuntimeError("all the islands failed")
+    listener.save_best(best_result)
+    return best_result, best_fitness
+
+
+class Migration(object):
+
+    def __init__(self, interval, inbox, outbox):
+        self.interval = interval
+        self.inbox = inbox
+        self.outbox = outbox
+        # migrants to an island that already finished are never read, do not wait for them on exit
+        self.outbox.cancel_join_thread()
+
+    def migrate(self, iteration, solver):
+        if (iteration + 1) % self.interval != 0:
+            return
+        best, fitness = solver.result()[:2]
+        self.outbox.put((np.asarray(best), fitness))
+        # never waits for the previous island, which may be slower or (e.g., with restarts) already done
+        while True:
+            try:
+                solver.inject(*self.inbox.get_nowait())
+            except queue.Empty:
+                break
+
+
+def island_wrapper(args):
+    config, file_name, i, inbox, outbox, results = args
+    config = dict(config, seed=config["seed"] + i, np=config["np"] // config["islands"],
+                  evaluations=config["evaluations"] // config["islands"])
+    listener = None
+    try:
+        set_seed(config["seed"])
+        solver = create_solver(config)
+        listener = FileListener.create_listener(config, ".".join([file_name, "island{}".format(i)]),
+                                                get_log_header(solver))
+        iterations = config["evaluations"] // solver.popsize
+        best_result, best_fitness = parallel_solve(solver, iterations, config, listener,
+                                                   Migration(config["migration_interval"], inbox, outbox))
+    except Exception as e:
+        # otherwise island_solve would wait for this island forever
+        logging.exception("island {} failed".format(i))
+        results.put((i, None, None, repr(e)))
+        return
+    finally:
+        # processes exit without running atexit handlers
+        if listener is not None:
+            listener.close()
+    results.put((i, np.asarray(best_result), best_fitness, None))
+
+
+class InterleavedScheduler(object):
+    """Advances several runs (e.g., different seeds or tasks) on the same pool: the candidates of all of them are
+    queued to the same workers, so that while a run waits for its slowest episodes or tells its solver, the workers
+    simulate the others. Every run draws from a random state of its own, so it evolves exactly as it would alone."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.runs = {}
+        self.ready = queue.Queue()
+        self.finished = collections.deque()
+
+    def add(self, key, solver, iterations, config, listener):
+        """To be called right after seeding and creating the solver, as parallel_solve would be."""
+        steps = solve_steps(solver, iterations, config, listener, pool=self.pool,
+                            callback=lambda _: self.ready.put(key))
+        self.runs[key] = [steps, get_random_state()]
+        self._advance(key)
+
+    def _advance(self, key):
+        steps, state = self.runs[key]
+        set_random_state(state)
+        try:
+            next(steps)
+        except StopIteration as e:
+            del self.runs[key]
+            self.finished.append((key, e.value, None))
+        except Exception as e:
+            del self.runs[key]
+            self.finished.append((key, None, e))
+        else:
+            self.runs[key][1] = get_random_state()
+
+    def wait(self):
+        """Advances the runs as their generations are evaluated, until one of them is over; returns its key, its best
+        solution and fitness, and the exception that stopped it (if any)."""
+        while not self.finished:
+            if not self.runs:
+                raise ValueError("Invalid wait: no runs left")
+            key = self.ready.get()
+            # a run that failed may still be notified of the generation it had submitted
+            if key in self.runs:
+                self._advance(key)
+        return self.finished.popleft()
+
+
+def get_log_header(solver):
+    header = ["iteration", "elapsed.sec", "evaluations", "best.fitness"]
+    if hasattr(solver, "restarts"):
+        header += ["popsize", "restarts"]
+    return header + ["solver.sec"] + TELEMETRY
+
+
+# per generation: rollout seconds (mean and max, to spot slow episodes or workers), seconds to build the simulation,
+# steps simulated (total) and simulated per second, seconds in each part of a step (mean per rollout) and the peak
+# resident memory of the workers
+TELEMETRY = ["rollout.sec", "rollout.max.sec", "construction.sec", "steps", "steps.per.sec", "world.step.sec",
+             "physics.step.sec", "sensor.sec", "controller.sec", "apply.control.sec", "should.step.sec", "peak.rss.mb"]
+
+
+def aggregate_telemetry(telemetry_list):
+    rollout_times = [telemetry["rollout.sec"] for telemetry in telemetry_list]
+    steps = sum([telemetry["steps"] for telemetry in telemetry_list])
+    aggregated = {col: float(np.mean([telemetry[col] for telemetry in telemetry_list]))
+                  for col in ["rollout.sec", "construction.sec", "world.step.sec", "physics.step.sec", "sensor.sec",
+                              "controller.sec", "apply.control.sec", "should.step.sec"]}
+    aggregated.update(**{"rollout.max.sec": max(rollout_times), "steps": steps,
+                         "steps.per.sec": steps / max(sum([telemetry["episode.sec"]
+                                                           for telemetry in telemetry_list]), 1e-9),
+                         "peak.rss.mb": max([telemetry["peak.rss.mb"] for telemetry in telemetry_list])})
+    return aggregated
+
+
+def submit_generation(pool, solver, config, center=None, callback=None):
+    # solvers that only work in float64 (e.g., pycma) are cast, to send no more than needed
+    solutions = np.asarray(solver.ask(), dtype=config["dtype"])
+    perturbations = solver.get_perturbations() if center is not None else None
+    if perturbations is not None:
+        mu, sigma, offsets, signs = perturbations
+        center[0] = mu
+        center[1] = sigma
+        return pool.map_async(noise_parallel_wrapper, [(config, offsets[i], signs[i], i)
+                                                       for i in range(solver.popsize)], chunksize=1,
+                              callback=callback, error_callback=callback), solutions
+    return pool.map_async(parallel_wrapper, [(config, solutions[i], i) for i in range(solver.popsize)],
+                          chunksize=1, callback=callback, error_callback=callback), solutions
+
+
 def parallel_wrapper(args):
     config, solution, i = args
-    fitness = simulation(config, solution, render=False)
-    return i, fitness
+    telemetry = {"pid": os.getpid()}
+    if int(config["profile"]) > 1:
+        fitness, telemetry["profile"] = Profiler.profile(simulation, dict(config, save_video=0), solution,
+                                                         render=False, telemetry=telemetry)
+    else:
+        fitness = simulation(dict(config, save_video=0), solution, render=False, telemetry=telemetry)
+    return i, fitness, telemetry
+
+
+_noise = None
+
+
+def init_noise_worker(noise_table, center):
+    global _noise
+    _noise = noise_table, np.ctypeslib.as_array(center).reshape(2, -1)
+
+
+def noise_parallel_wrapper(args):
+    config, offset, sign, i = args
+    noise_table, center = _noise
+    return parallel_wrapper((config, noise_table.perturb(center[0], center[1], offset, sign), i))
+
+
+class ReplayQueue(object):
+    """Replays bests in a process of its own, one at a time. A best found while another one is replayed waits, and
+    replaces the one that was waiting, if any, so that no backlog builds up while evolution improves quickly."""
+
+    def __init__(self):
+        self.pool = Pool(1)
+        self.busy = False
+        self.waiting = None
+        # the next replay is started by the thread of the pool that reports the previous one as done
+        self.condition = threading.Condition()
+
+    def submit(self, args):
+        with self.condition:
+            self.waiting = args
+            self._start()
+
+    def _start(self):
+        if self.busy or self.waiting is None:
+            return
+        args, self.waiting = self.waiting, None
+        self.busy = True
+        self.pool.apply_async(replay_wrapper, (args, ), callback=self._done, error_callback=self._done)
+
+    def _done(self, _):
+        with self.condition:
+            self.busy = False
+            self._start()
+            self.condition.notify_all()
+
+    def close(self):
+        # waits for (at most) the replay running and the latest best
+        with self.condition:
+            self.condition.wait_for(lambda: not self.busy and self.waiting is None)
+        self.pool.close()
+        self.pool.join()
+
 
+def replay_wrapper(args):
+    config, solution, replay_file = args
+    simulation(dict(config, save_video=0), solution, render=False, replay_file=replay_file)
+    if int(config["save_video"]):
+        render_replay((replay_file, config))
 
-def simulation(config, solution, render):
+
+def simulation(config, solution, render, replay_file=None, telemetry=None):
+    start = time.perf_counter()
     if render:
+        from pygame_simulators import RenderSimulator
         framework = RenderSimulator(config, solution, save_video=int(config["save_video"]))
     else:
         framework = NoRenderSimulator(config, solution, save_video=int(config["save_video"]))
+    recorder = ReplayRecorder(framework.env, framework.morphology) if replay_file is not None else None
+    constructed = time.perf_counter()
     while framework.should_step():
         framework.step()
+        if recorder is not None:
+            recorder.record(framework.morphology)
     fitness = framework.env.get_fitness(framework.morphology, config["timesteps"])
+    if telemetry is not None:
+        end = time.perf_counter()
+        telemetry.update(**framework.timers)
+        # ru_maxrss is in kilobytes on Linux
+        telemetry.update(**{"rollout.sec": end - start, "construction.sec": constructed - start,
+                            "episode.sec": end - constructed, "steps": framework.get_step_count(),
+                            "peak.rss.mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+    if recorder is not None:
+        recorder.save(replay_file)
     framework.reset()
     return fitness
 
@@ -54,6 +404,7 @@ def simulation(config, solution, render):
 def inflate_simulation(config, listener, render):
     solution = np.empty(0)
     if render:
+        from pygame_simulators import RenderSimulator
         framework = RenderSimulator(config, solution, save_video=int(config["save_video"]))
     else:
         framework = NoRenderSimulator(config, solution, save_video=int(config["save_video"]))
@@ -66,3 +417,68 @@ def inflate_simulation(config, listener, render):
             listener.listen(**{"t": framework.get_step_count(), "p": framework.morphology.pressure.current,
                                "a": area, "r": area / (config["r"] ** 2 * math.pi)})
     framework.reset()
+
+
+# the parameters an inflate sweep can vary, and a row of its results: the steps simulated, whether pressure and area
+# converged, and their mean (with the ratio of the area to that of the circle of radius r, and how much the area
+# oscillates) over the last steps
+INFLATE_SWEEP = ["T", "mass", "r", "n_masses"]
+INFLATE_DTYPE = np.dtype([("T", np.float64), ("mass", np.float64), ("r", np.float64), ("n_masses", np.int32),
+                          ("steps", np.int32), ("converged", np.bool_), ("p", np.float64), ("a", np.float64),
+                          ("ratio", np.float64), ("a_std", np.float64)])
+
+
+def inflate_sweep(config):
+    """Inflates a body for every combination of the values in config["inflate_sweep"] (e.g., {T: [273, 300], r: [5,
+    10]}, the current value for the parameters it does not list), on config["np"] workers; returns a record array of
+    INFLATE_DTYPE with a row per combination."""
+    points = list(itertools.product(*[config["inflate_sweep"].get(key, [config[key]]) for key in INFLATE_SWEEP]))
+    with Pool(config["np"]) as pool:
+        results = pool.map(inflate_wrapper, [(dict(config, T=float(T), mass=float(mass), r=float(r),
+                                                   n_masses=int(n_masses)), ) for T, mass, r, n_masses in points],
+                           chunksize=1)
+    sweep = np.zeros(len(points), dtype=INFLATE_DTYPE)
+    for i, (point, result) in enumerate(zip(points, results)):
+        sweep[i] = tuple(point) + result
+    return sweep
+
+
+def inflate_wrapper(args):
+    config, = args
+    # as in inflate mode, only pressure is controlled
+    config = dict(config, brain="inflate", control_pressure=1, save_video=0)
+    config["n_params"] = 0
+    return inflate_episode(config, config["inflate_tolerance"], config["inflate_window"])
+
+
+def inflate_episode(config, tolerance, window):
+    """inflate_simulation without rendering nor logging, which stops as soon as the mean pressure and area over window
+    steps changed by no more than tolerance (relative) from the previous window steps. The area keeps oscillating
+    once inflated, so window should span at least a period (about 240 steps for the default body)."""
+    framework = NoRenderSimulator(config, np.empty(0))
+    framework.morphology.pressure.min = 0
+    framework.morphology.pressure.current = 0
+    # pressure and area of the last window steps, as a ring
+    history = np.zeros((window, 2))
+    previous = None
+    t = 0
+    converged = False
+    while framework.should_step():
+        framework.step()
+        t = framework.get_step_count()
+        # the controller starts inflating after 360 steps
+        if t <= 360:
+            continue
+        history[t % window] = framework.morphology.pressure.current, framework.morphology.get_area()
+        if (t - 360) % window == 0:
+            mean = history.mean(axis=0)
+            if previous is not None and np.all(np.abs(mean - previous) <= tolerance * np.abs(mean)):
+                converged = True
+                break
+            previous = mean
+    framework.reset()
+    # the ring is still partly empty if the episode ended before a whole window was inflated
+    if t - 360 < window:
+        return t, converged, np.nan, np.nan, np.nan, np.nan
+    p, a = history.mean(axis=0)
+    return t, converged, p, a, a / (config["r"] ** 2 * math.pi), history[:, 1].std()
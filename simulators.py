@@ -1,15 +1,10 @@
 import abc
 import time
-import os
-import shutil
 
-import gym
-import numpy as np
-import pygame
-from Box2D.examples.framework import Framework
-from Box2D.examples.framework import FrameworkBase
+from Box2D import b2World
 
 from controllers import BaseController
+from listener import FileListener
 from tasks import BaseEnv
 from utils import create_soft_body
 
@@ -18,20 +13,19 @@ class BaseSimulator(abc.ABC):
 
     def __init__(self, config, solution, save_video=False):
         self.config = config
+        # seconds spent in each part of a step, summed over the episode
+        self.timers = dict.fromkeys(["world.step.sec", "physics.step.sec", "sensor.sec", "controller.sec",
+                                     "apply.control.sec", "should.step.sec"], 0.0)
         self.init_objects(solution)
         self.name = "{}-based Soft Agent".format(config["body"].capitalize())
         self.description = "Demonstration of a {}-based soft agent simulation.".format(config["body"])
         if save_video:
-            self.save_dir = os.path.join(os.getcwd(), "frames")
-            if os.path.isdir(self.save_dir):
-                shutil.rmtree(self.save_dir)
-            os.mkdir(self.save_dir)
-            pygame.init()
-            self.screen = pygame.Surface((750, 750))
-            self.screen.fill((0, 0, 0))
+            # drawing needs pygame, which headless simulations never import
+            from renderer import BaseRenderer
+            self.video = BaseRenderer.create_renderer(config, False, FileListener.get_video_file_name(
+                FileListener.get_run_file_name(config), config["size"]))
         else:
-            self.save_dir = None
-        self.magnify = 15
+            self.video = None
 
     def init_objects(self, solution):
         self.env = BaseEnv.create_env(self.config, self.get_world())
@@ -50,8 +44,9 @@ class BaseSimulator(abc.ABC):
 
     def step(self):
         self.inner_step()
-        if self.save_dir is not None:
-            self._draw_image(self.env, os.path.join(self.save_dir, ".".join([str(self.get_step_count()), "png"])))
+        if self.video is not None and self.video.should_draw(self.get_step_count()):
+            self.video.draw_image(self)
+            self.video.render()
 
     @abc.abstractmethod
     def inner_step(self):
@@ -67,91 +62,69 @@ class BaseSimulator(abc.ABC):
             for fixture in body.fixtures:
                 body.DestroyFixture(fixture)
             world.DestroyBody(body)
-        if self.save_dir is not None:
-            self._save_video()
-            shutil.rmtree(self.save_dir)
+        if self.video is not None:
+            self.video.close()
         return obs
 
-    def _draw_image(self, env, file_name):
-        w, h = self.screen.get_width(), self.screen.get_height()
-        center_x, center_y = self.morphology.get_center_of_mass()
-        env.draw_env(w, h, (center_x, center_y), self.screen, self.magnify)
-        for mass in self.morphology.masses:
-            shape = mass.fixtures[0].shape
-            half_width = abs(shape.vertices[0][0] - shape.vertices[1][0]) / 2
-            half_height = abs(shape.vertices[0][1] - shape.vertices[2][1]) / 2
-            cx, cy = mass.position.x, mass.position.y
-            vertices = [(cx - half_width, cy - half_height), (cx + half_width, cy - half_height),
-                        (cx + half_width, cy + half_height), (cx - half_width, cy + half_height)]
-            new_vertices = [
-                ((x - center_x) * self.magnify + w / 2, h - ((y - center_y) * self.magnify + h / 2)) for
-                x, y in vertices]
-            pygame.draw.rect(self.screen, (255, 0, 0),
-                             (new_vertices[3][0], new_vertices[3][1],
-                              half_width * 2 * self.magnify, half_height * 2 * self.magnify), 0)
-            pygame.draw.rect(self.screen, (219, 112, 147),
-                             (new_vertices[3][0], new_vertices[3][1],
-                              half_width * 2 * self.magnify, half_height * 2 * self.magnify), 2)
-        for joint in self.morphology.joints:
-            l_x, l_y, r_x, r_y = (joint.anchorA.x - center_x) * self.magnify + w / 2, \
-                                 (joint.anchorA.y - center_y) * self.magnify + h / 2, \
-                                 (joint.anchorB.x - center_x) * self.magnify + w / 2, \
-                                 (joint.anchorB.y - center_y) * self.magnify + h / 2
-            pygame.draw.lines(self.screen, (255, 255, 255), False, [(l_x, h - l_y), (r_x, h - r_y)], 3)
-        pygame.image.save(self.screen, file_name)
-        self.screen.fill((0, 0, 0))
-
-    def _save_video(self):
-        os.system("ffmpeg -r 60 -i ./frames/%d.png -vcodec mpeg4 -vf format=yuv420p -y {}".format(
-            ".".join([self.config["task"].split("-")[0], str(self.config["seed"]), "mp4"])))
-
     def should_step(self):
-        return self.get_step_count() < self.config["timesteps"] and self.env.should_step(self.morphology)
+        start = time.perf_counter()
+        should_step = self.get_step_count() < self.config["timesteps"] and self.env.should_step(self.morphology)
+        self.timers["should.step.sec"] += time.perf_counter() - start
+        return should_step
+
+    def physics_step(self, settings):
+        start = time.perf_counter()
+        self.step_world(settings)
+        stepped = time.perf_counter()
+        self.morphology.physics_step()
+        self.timers["world.step.sec"] += stepped - start
+        self.timers["physics.step.sec"] += time.perf_counter() - stepped
 
     def act(self, t):
+        start = time.perf_counter()
         obs = self.morphology.get_obs()
+        sensed = time.perf_counter()
         control = self.controller.control(t, obs)
+        controlled = time.perf_counter()
         self.morphology.apply_control(control)
+        self.timers["sensor.sec"] += sensed - start
+        self.timers["controller.sec"] += controlled - sensed
+        self.timers["apply.control.sec"] += time.perf_counter() - controlled
 
 
-class RenderSimulator(Framework, BaseSimulator):
+class WorldSettings(object):
+    """The settings of Box2D's example framework that matter without drawing (its defaults)."""
+    hz = 60.0
+    velocityIterations = 8
+    positionIterations = 3
+    enableWarmStarting = True
+    enableContinuous = True
+    enableSubStepping = False
 
-    def __init__(self, config, solution, save_video=False):
-        Framework.__init__(self)
-        BaseSimulator.__init__(self, config, solution, save_video)
-        self.gui_table.updateGUI(self.settings)
-        self.clock = pygame.time.Clock()
 
-    def get_world(self):
-        return self.world
+class HeadlessFramework(object):
+    """What Box2D's FrameworkBase does without drawing, which imports neither pygame nor the example framework (that
+    also parses sys.argv), and registers no contact listener, that would be called back for every contact."""
 
-    def get_step_count(self):
-        return self.stepCount
-
-    def inner_step(self):
-        self.checkEvents()
-        self.screen.fill((0, 0, 0))
-        self.CheckKeys()
-        self.SimulationLoop()
-        if self.settings.drawMenu:
-            self.gui_app.paint(self.screen)
-        pygame.display.flip()
-        self.clock.tick(self.settings.hz)
-        self.fps = self.clock.get_fps()
+    def __init__(self):
+        self.world = b2World(gravity=(0, -10), doSleep=True)
+        self.settings = WorldSettings()
+        self.stepCount = 0
+        self.renderer = None
 
-    def Step(self, settings):
-        settings.drawMenu = False
-        settings.drawStats = False
-        settings.drawFPS = False
-        FrameworkBase.Step(self, settings)
-        self.morphology.physics_step()
-        self.act(self.stepCount)
+    def step_world(self, settings):
+        self.stepCount += 1
+        self.world.warmStarting = settings.enableWarmStarting
+        self.world.continuousPhysics = settings.enableContinuous
+        self.world.subStepping = settings.enableSubStepping
+        self.world.Step(1.0 / settings.hz, settings.velocityIterations, settings.positionIterations)
+        self.world.ClearForces()
 
 
-class NoRenderSimulator(BaseSimulator, FrameworkBase):
+class NoRenderSimulator(BaseSimulator, HeadlessFramework):
 
     def __init__(self, config, solution, save_video=False):
-        FrameworkBase.__init__(self)
+        HeadlessFramework.__init__(self)
         BaseSimulator.__init__(self, config, solution, save_video)
         self.renderer = None
         self.world.renderer = self.renderer
@@ -170,52 +143,5 @@ class NoRenderSimulator(BaseSimulator, FrameworkBase):
         self.Step(self.settings)
 
     def Step(self, settings):
-        FrameworkBase.Step(self, settings)
-        self.morphology.physics_step()
+        self.physics_step(settings)
         self.act(self.stepCount)
-
-
-class NoRenderRLSimulator(BaseSimulator, FrameworkBase, gym.Env):
-
-    def __init__(self, config, solution, listener, save_video=False):
-        FrameworkBase.__init__(self)
-        BaseSimulator.__init__(self, config, solution, save_video)
-        self.renderer = None
-        self.world.renderer = self.renderer
-        self.groundbody = self.world.CreateBody()
-        self.action_space = gym.spaces.Box(low=np.array([-1.0 for _ in range(self.morphology.get_output_dim())],
-                                                        dtype=np.float32),
-                                           high=np.array([1.0 for _ in range(self.morphology.get_output_dim())],
-                                                         dtype=np.float32))
-        self.observation_space = gym.spaces.Box(low=np.array([0.0 for _ in range(self.morphology.get_input_dim())],
-                                                             dtype=np.float32),
-                                                high=np.array([1.0 for _ in range(self.morphology.get_input_dim())],
-                                                              dtype=np.float32))
-        self.listener = listener
-        self.start = time.time()
-
-    def get_world(self):
-        return self.world
-
-    def get_step_count(self):
-        return self.stepCount
-
-    def inner_step(self, action):
-        self.SimulationLoop()
-        self.morphology.apply_control(action)
-        obs = self.morphology.get_obs()
-        reward = self.env.get_reward(self.morphology, self.get_step_count())
-        return obs, reward, False, {}
-
-    def render(self, mode="human"):
-        pass
-
-    def SimulationLoop(self):
-        self.Step(self.settings)
-
-    def Step(self, settings):
-        FrameworkBase.Step(self, settings)
-        self.morphology.physics_step()
-
-
-gym.envs.registration.register(id="RL-v0", entry_point="simulators:NoRenderRLSimulator", max_episode_steps=600)
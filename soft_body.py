@@ -16,10 +16,12 @@ class SpringData(object):
 
 class Sensor(object):
 
-    def __init__(self, dim, window_size, morphology):
+    def __init__(self, dim, window_size, morphology, dtype=np.float64):
         self.dim = dim
-        self.window_size = window_size
-        self._memory = np.empty((0, dim))
+        self.window_size = int(math.ceil(window_size))
+        # the last window_size observations, oldest first, in a buffer allocated once
+        self._memory = np.empty((self.window_size, dim), dtype=dtype)
+        self._size = 0
         self.prev_pos = morphology.get_center_of_mass()
 
     def sense(self, morphology):
@@ -40,13 +42,15 @@ class Sensor(object):
             elif i == len(obs) - 1:
                 obs[i] /= morphology.pressure.max
         self._realloc_memory(obs)
-        obs = np.mean(self._memory, axis=0)
+        obs = np.mean(self._memory[:self._size], axis=0)
         return obs
 
     def _realloc_memory(self, obs):
-        if len(self._memory) >= self.window_size:
-            self._memory = np.delete(self._memory, 0, axis=0).reshape(-1, self.dim)
-        self._memory = np.append(self._memory, obs.reshape(1, -1), axis=0).reshape(-1, self.dim)
+        if self._size >= self.window_size:
+            self._memory[:-1] = self._memory[1:]
+        else:
+            self._size += 1
+        self._memory[self._size - 1] = obs
 
 
 class BaseSoftBody(abc.ABC):
@@ -119,16 +123,21 @@ class PressureSoftBody(BaseSoftBody):
         self.masses = []
         self.joints = []
         self._add_masses(fixture)
-        self.sensor = Sensor(self.n_masses * 3 + 2 + 1, 0.25 * 60, self)
+        self.sensor = Sensor(self.n_masses * 3 + 2 + 1, 0.25 * 60, self, np.dtype(config["dtype"]))
         self.control_pressure = config["control_pressure"]
         self.control_joints = config["control_joints"]
         max_p = self.get_maximum_pressure(self.T, self.mass, self.r)
         min_p = max_p * 0.2
         self.pressure = PressureData(self._compute_pressure(), min_p, (max_p - min_p) / 2 + min_p, max_p)
 
+    @staticmethod
+    def get_pressure_at_rest(T, mass, r):
+        # the pressure of the gas in the circle of radius r
+        return (PressureSoftBody.R * T * mass * PressureSoftBody.mol) / (r ** 2 * math.pi)
+
     @staticmethod
     def get_maximum_pressure(T, mass, r):
-        return ((PressureSoftBody.R * T * mass * PressureSoftBody.mol) / (r ** 2 * math.pi)) * 1.25
+        return PressureSoftBody.get_pressure_at_rest(T, mass, r) * 1.25
 
     def _add_masses(self, fixture):
         delta_theta = (360 * math.pi / 180) / self.n_masses
@@ -1,8 +1,8 @@
 import abc
+import logging
 import os
 import random
 
-import pygame
 from Box2D import b2EdgeShape, b2FixtureDef, b2CircleShape
 
 
@@ -31,10 +31,6 @@ class BaseEnv(abc.ABC):
     def get_fitness(self, morphology, t):
         pass
 
-    @abc.abstractmethod
-    def draw_env(self, w, h, center, screen, magnify):
-        pass
-
     @classmethod
     def create_env(cls, config, world):
         name = config["task"]
@@ -81,27 +77,32 @@ class FlatLocomotion(BaseEnv):
     def get_fitness(self, morphology, t):
         return (morphology.get_center_of_mass()[0] - self.get_initial_pos()[0]) / (t / 60.0)
 
-    def draw_env(self, w, h, center, screen, magnify):
-        center_x, center_y = center
-        for body in self.bodies:
-            vertices = body.fixtures[0].shape.vertices
-            l_x, l_y, r_x, r_y = (vertices[0][0] - center_x) * magnify + w / 2, \
-                                 (vertices[0][1] - center_y) * magnify + h / 2, \
-                                 (vertices[1][0] - center_x) * magnify + w / 2, \
-                                 (vertices[1][1] - center_y) * magnify + h / 2
-            pygame.draw.lines(screen, (0, 0, 255), False, [(l_x, h - l_y), (r_x, h - r_y)], 5)
 
 
 class HillyLocomotion(BaseEnv):
+    # seeds whose legacy terrain this process already warned about
+    legacy_warned = set()
 
     def __init__(self, world, config):
         BaseEnv.__init__(self, world)
+        if len(config["task"].split("-")) != 3:
+            raise ValueError("Invalid task name: {} (hilly-<height>-<width>, e.g. hilly-3-10)".format(config["task"]))
         self.h = int(config["task"].split("-")[1])
         self.w = int(config["task"].split("-")[2])
         self.r = config["r"]
         if not os.path.isdir(os.path.join(os.getcwd(), "terrains")):
             os.mkdir(os.path.join(os.getcwd(), "terrains"))
-        self.file_name = os.path.join(os.getcwd(), "terrains", ".".join(["hilly", str(config["seed"]), "txt"]))
+        # one terrain per height, width and seed
+        self.file_name = os.path.join(os.getcwd(), "terrains", ".".join([config["task"], str(config["seed"]), "txt"]))
+        # terrains of earlier versions were kept per seed only, and are still used so that their results reproduce
+        legacy_file_name = os.path.join(os.getcwd(), "terrains", ".".join(["hilly", str(config["seed"]), "txt"]))
+        if not os.path.isfile(self.file_name) and os.path.isfile(legacy_file_name):
+            self.file_name = legacy_file_name
+            if config["seed"] not in HillyLocomotion.legacy_warned:
+                HillyLocomotion.legacy_warned.add(config["seed"])
+                logging.warning("{} is used for {} (and any other height and width), rename it to {} to keep it for "
+                                "{} only".format(legacy_file_name, config["task"],
+                                                 ".".join([config["task"], str(config["seed"]), "txt"]), config["task"]))
         self.prev_pos = self.get_initial_pos()[0]
 
     def init_env(self):
@@ -142,8 +143,10 @@ class HillyLocomotion(BaseEnv):
             prev_height = height
             end += max(random.gauss(1, 0.25) * self.w, 1.0)
             height = abs(random.gauss(0, self.h))
-        with open(self.file_name, "w") as file:
+        # written aside and renamed, so that processes drawing the same terrain at once never read it half-written
+        with open(self.file_name + ".{}.tmp".format(os.getpid()), "w") as file:
             file.write(content)
+        os.replace(self.file_name + ".{}.tmp".format(os.getpid()), self.file_name)
 
     def get_initial_pos(self):
         return 0, self.r * 1.5
@@ -157,15 +160,6 @@ class HillyLocomotion(BaseEnv):
     def get_fitness(self, morphology, t):
         return (morphology.get_center_of_mass()[0] - self.get_initial_pos()[0]) / (t / 60.0)
 
-    def draw_env(self, w, h, center, screen, magnify):
-        center_x, center_y = center
-        for body in self.bodies:
-            vertices = body.fixtures[0].shape.vertices
-            l_x, l_y, r_x, r_y = (vertices[0][0] - center_x) * magnify + w / 2, \
-                                 (vertices[0][1] - center_y) * magnify + h / 2, \
-                                 (vertices[1][0] - center_x) * magnify + w / 2, \
-                                 (vertices[1][1] - center_y) * magnify + h / 2
-            pygame.draw.lines(screen, (0, 0, 255), False, [(l_x, h - l_y), (r_x, h - r_y)], 5)
 
 
 class Escape(BaseEnv):
@@ -230,15 +224,6 @@ class Escape(BaseEnv):
     def get_fitness(self, morphology, t):
         return abs(morphology.get_center_of_mass()[0]) - self.get_initial_pos()[0]
 
-    def draw_env(self, w, h, center, screen, magnify):
-        center_x, center_y = center
-        for body in self.bodies:
-            vertices = body.fixtures[0].shape.vertices
-            l_x, l_y, r_x, r_y = (vertices[0][0] - center_x) * magnify + w / 2, \
-                                 (vertices[0][1] - center_y) * magnify + h / 2, \
-                                 (vertices[1][0] - center_x) * magnify + w / 2, \
-                                 (vertices[1][1] - center_y) * magnify + h / 2
-            pygame.draw.lines(screen, (0, 0, 255), False, [(l_x, h - l_y), (r_x, h - r_y)], 5)
 
 
 class Climber(BaseEnv):
@@ -276,15 +261,6 @@ class Climber(BaseEnv):
     def get_fitness(self, morphology, t):
         return morphology.get_center_of_mass()[1] - self.get_initial_pos()[1]
 
-    def draw_env(self, w, h, center, screen, magnify):
-        center_x, center_y = center
-        for body in self.bodies:
-            vertices = body.fixtures[0].shape.vertices
-            l_x, l_y, r_x, r_y = (vertices[0][0] - center_x) * magnify + w / 2, \
-                                 (vertices[0][1] - center_y) * magnify + h / 2, \
-                                 (vertices[1][0] - center_x) * magnify + w / 2, \
-                                 (vertices[1][1] - center_y) * magnify + h / 2
-            pygame.draw.lines(screen, (0, 0, 255), False, [(l_x, h - l_y), (r_x, h - r_y)], 5)
 
 
 class CaveCrawler(BaseEnv):
@@ -438,15 +414,6 @@ class CaveCrawler(BaseEnv):
     def get_fitness(self, morphology, t):
         return (morphology.get_center_of_mass()[0] - self.get_initial_pos()[0]) / (t / 60.0)
 
-    def draw_env(self, w, h, center, screen, magnify):
-        center_x, center_y = center
-        for body in self.bodies:
-            vertices = body.fixtures[0].shape.vertices
-            l_x, l_y, r_x, r_y = (vertices[0][0] - center_x) * magnify + w / 2, \
-                                 (vertices[0][1] - center_y) * magnify + h / 2, \
-                                 (vertices[1][0] - center_x) * magnify + w / 2, \
-                                 (vertices[1][1] - center_y) * magnify + h / 2
-            pygame.draw.lines(screen, (0, 0, 255), False, [(l_x, h - l_y), (r_x, h - r_y)], 5)
 
 
 class Carrier(BaseEnv):
@@ -487,21 +454,3 @@ class Carrier(BaseEnv):
         # if all([self.bodies[0] not in mass.contacts for mass in morphology.masses]):
         #     return 0.0
         return (morphology.get_center_of_mass()[0] - self.get_initial_pos()[0]) / (t / 60.0)
-
-    def draw_env(self, w, h, center, screen, magnify):
-        center_x, center_y = center
-        vertices = self.bodies[0].fixtures[0].shape.vertices
-        l_x, l_y, r_x, r_y = (vertices[0][0] - center_x) * magnify + w / 2, \
-                             (vertices[0][1] - center_y) * magnify + h / 2, \
-                             (vertices[1][0] - center_x) * magnify + w / 2, \
-                             (vertices[1][1] - center_y) * magnify + h / 2
-        pygame.draw.lines(screen, (0, 0, 255), False, [(l_x, h - l_y), (r_x, h - r_y)], 5)
-
-        shape = self.bodies[1].fixtures[0].shape
-        cx, cy = self.bodies[1].position.x, self.bodies[1].position.y
-        pygame.draw.circle(screen, (255, 0, 0), ((cx - center_x) * magnify + w / 2,
-                                                 h - ((cy - center_y) * magnify + h / 2)),
-                           shape.radius * magnify, 0)
-        pygame.draw.circle(screen, (219, 112, 147), ((cx - center_x) * magnify + w / 2,
-                                                     h - ((cy - center_y) * magnify + h / 2)),
-                           shape.radius * magnify, 2)
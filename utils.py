@@ -1,19 +1,29 @@
 import math
 import random
+import sys
 
 import numpy as np
-import torch
 
-from es import OpenES, SimpleGA, CMAES, PEPG
+from es import OpenES, SimpleGA, CMAES, PEPG, SepCMAES, LMMAES, SharedNoiseTable, RestartCMAES
 from pressure import PressureSoftBody
-from tensegrity import TensegritySoftBody
-from voxel import VoxelSoftBody
+from soft_body import TensegritySoftBody, VoxelSoftBody
 
 
 def set_seed(seed):
     random.seed(seed)
     np.random.seed(seed)
-    torch.manual_seed(seed)
+    # torch is only imported for mlp brains, whose weights are all set from the solution anyway
+    if "torch" in sys.modules:
+        sys.modules["torch"].manual_seed(seed)
+
+
+def get_random_state():
+    return random.getstate(), np.random.get_state()
+
+
+def set_random_state(state):
+    random.setstate(state[0])
+    np.random.set_state(state[1])
 
 
 def random_solution(config):
@@ -23,15 +33,27 @@ def random_solution(config):
 def create_solver(config):
     name = config["solver"]
     n_params = config["n_params"]
+    noise_table = SharedNoiseTable(config["noise_table_size"], config["seed"]) \
+        if name in ["es", "pepg"] and config["noise_table_size"] > 0 else None
     if name == "es":
-        return OpenES(n_params, popsize=40, rank_fitness=False, forget_best=False)
+        return OpenES(n_params, popsize=40, rank_fitness=False, forget_best=False, noise_table=noise_table,
+                      dtype=config["dtype"])
     elif name == "ga":
-        return SimpleGA(n_params, popsize=96)
-    elif name == "cmaes":
+        return SimpleGA(n_params, popsize=96, dtype=config["dtype"])
+    elif name in ["ipop-cmaes", "bipop-cmaes"]:
+        return RestartCMAES(n_params, sigma_init=0.5, popsize_unit=config["np"], regime=name.split("-")[0],
+                            patience=config["restart_patience"])
+    elif name in ["cmaes", "sep-cmaes", "lm-cmaes"]:
         pop_size = 4 + math.floor(3 * math.log(n_params))
-        return CMAES(n_params, sigma_init=0.5, popsize=pop_size + (config["np"] - pop_size % config["np"]))
+        # rounded up to a multiple of np (earlier versions added np to populations that already were one)
+        pop_size += - pop_size % config["np"]
+        if name == "sep-cmaes":
+            return SepCMAES(n_params, sigma_init=0.5, popsize=pop_size)
+        elif name == "lm-cmaes":
+            return LMMAES(n_params, sigma_init=0.5, popsize=pop_size)
+        return CMAES(n_params, sigma_init=0.5, popsize=pop_size)
     elif name == "pepg":
-        return PEPG(n_params, forget_best=False)
+        return PEPG(n_params, forget_best=False, noise_table=noise_table, dtype=config["dtype"])
     raise ValueError("Invalid solver name: {}".format(name))
 
 